@@ -0,0 +1,142 @@
+"""
+How fast a bot improves its deck, turn by turn, when it plays alone.
+
+IdealistComboBot.test compares a strategy against one of these curves. A
+curve depends on the bot, the kingdom cards in the supply and the number of
+turns, so it is computed when it's first needed, on a pool of worker
+processes, and saved in the cache directory as a .npy file. Later requests
+for the same configuration load it from there:
+
+    curve = baseline_curve(BigMoney(1, 2), variable_cards, turns=20)
+
+The cache directory is ~/.dominiate, or $DOMINIATE_CACHE if that is set.
+"""
+from game import Game
+from players import BigMoney
+from lockstep import LockstepGames, supported
+from tournament import WorkerPool
+import numpy as np
+import hashlib
+import logging
+import os
+
+log = logging.getLogger('baseline')
+
+CACHE_DIR = os.environ.get('DOMINIATE_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.dominiate'))
+
+def state_value(state):
+    """
+    The value of a player's whole deck: the total cost of its cards minus
+    the number of cards.
+    """
+    return state.stats.cost - state.stats.size
+
+# The curves that have been computed or loaded in this process.
+_curves = {}
+
+def curve_key(bot, var_cards, turns, games, seed):
+    "A string that identifies a baseline configuration."
+    cards = ','.join(sorted(card.name for card in var_cards))
+    return '%s|%s|%d|%d|%d' % (bot.name, cards, turns, games, seed)
+
+def cache_path(key):
+    digest = hashlib.sha1(key).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, 'baseline-%s.npy' % digest)
+
+def baseline_curve(bot=None, var_cards=(), turns=20, games=10000, seed=0,
+                   processes=None, cache=True):
+    """
+    Get the average improvement in deck value (see state_value) that `bot`
+    makes on each of its first `turns` turns, over `games` solitaire games
+    with the given kingdom cards. The bot defaults to BigMoney(1, 2).
+
+    The curve is loaded from the cache if it's there; otherwise it's
+    computed with compute_curve, and saved unless `cache` is False.
+    """
+    if bot is None:
+        bot = BigMoney(1, 2)
+    key = curve_key(bot, var_cards, turns, games, seed)
+    if key in _curves:
+        return _curves[key]
+    path = cache_path(key)
+    if cache and os.path.exists(path):
+        curve = np.load(path)
+    else:
+        log.info('Computing baseline for %s', key)
+        curve = compute_curve(bot, var_cards, turns, games, seed, processes)
+        if cache: save_curve(path, curve)
+    _curves[key] = curve
+    return curve
+
+def save_curve(path, curve):
+    "Save a curve, replacing the file in one step so readers never see half."
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    temp = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp, 'wb') as out:
+        np.save(out, curve)
+    os.rename(temp, path)
+
+def compute_curve(bot, var_cards=(), turns=20, games=10000, seed=0,
+                  processes=None):
+    """
+    Play the games for a baseline curve on a pool of `processes` worker
+    processes (by default, one per CPU; 1 plays them in this process).
+    Bots that LockstepGames can play, such as BigMoney, are played that
+    way instead, all in this process.
+    """
+    if supported(bot):
+        return compute_lockstep_curve(bot, turns, games, seed)
+    improvements = np.zeros((turns,))
+    counts = np.zeros((turns,), dtype='int32')
+    seeds = xrange(seed, seed + games)
+    pool = WorkerPool(processes, _init_worker, (bot, var_cards, turns))
+    try:
+        for deltas in pool.imap(play_curve_game, seeds, 50, ordered=False):
+            improvements[:len(deltas)] += deltas
+            counts[:len(deltas)] += 1
+    finally:
+        pool.close()
+    return improvements / np.maximum(counts, 1)
+
+def compute_lockstep_curve(bot, turns=20, games=10000, seed=0):
+    "compute_curve for a bot that LockstepGames can play."
+    improvements = np.zeros((turns,))
+    counts = np.zeros((turns,), dtype='int32')
+    lockstep = LockstepGames([bot], games, seed=seed)
+    for turn in xrange(turns):
+        if lockstep.done(): break
+        before = lockstep.deck_values(0)
+        live = lockstep.step()
+        deltas = lockstep.deck_values(0)[live] - before[live]
+        improvements[turn] = deltas.sum()
+        counts[turn] = len(live)
+    return improvements / np.maximum(counts, 1)
+
+# The configuration that play_curve_game uses in this process, set when a
+# worker process starts.
+_bot = None
+_var_cards = None
+_turns = None
+
+def _init_worker(bot, var_cards, turns):
+    global _bot, _var_cards, _turns
+    _bot = bot
+    _var_cards = var_cards
+    _turns = turns
+
+def play_curve_game(seed):
+    """
+    Play one solitaire game, and return how much the deck value changed on
+    each turn until the game ended or ran out of turns.
+    """
+    game = Game.setup([_bot], _var_cards, seed=seed, listeners=())
+    deltas = []
+    for turn in xrange(_turns):
+        before_value = state_value(game.state())
+        game = game.take_turn()
+        deltas.append(state_value(game.state()) - before_value)
+        if game.over(): break
+    return deltas
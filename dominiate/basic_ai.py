@@ -1,21 +1,25 @@
 from game import TrashDecision, DiscardDecision
 from players import AIPlayer, BigMoney
+from handsim import simulate_hands_batch
+from handdist import hand_distribution, expectation
+from cache import LRUCache
 import cards as c
+import numpy as np
 import logging, sys
 
 class SmithyBot(BigMoney):
     def __init__(self, cutoff1=3, cutoff2=6, cards_per_smithy=8):
-        self.cards_per_smithy = 8
+        self.cards_per_smithy = cards_per_smithy
         self.name = 'SmithyBot(%d, %d, %d)' % (cutoff1, cutoff2,
         cards_per_smithy)
         BigMoney.__init__(self, cutoff1, cutoff2)
     
     def num_smithies(self, state):
-        return list(state.all_cards()).count(c.smithy)
+        return state.deck_count(c.smithy)
 
     def buy_priority_order(self, decision):
         state = decision.state()
-        provinces_left = decision.game.card_counts[c.province]
+        provinces_left = decision.game.supply[c.province]
         if provinces_left <= self.cutoff1:
             order = [None, c.estate, c.silver, c.duchy, c.province]
         elif provinces_left <= self.cutoff2:
@@ -30,7 +34,29 @@ class SmithyBot(BigMoney):
     def make_act_decision(self, decision):
         return c.smithy
 
+# Simulated buy values, keyed by (bot class, deck composition, card to add,
+# simulation steps). It's shared by every HillClimbBot in the process.
+buy_value_cache = LRUCache(100000)
+
+def deck_composition(state):
+    "A hashable description of which cards are in a player's deck."
+    counts = list(state.deck_counts())
+    while counts and not counts[-1]:
+        counts.pop()
+    return tuple(counts)
+
 class HillClimbBot(BigMoney):
+    # set this to None to simulate every decision from scratch
+    cache = buy_value_cache
+    # set this to False to always sample hands, even when the exact value
+    # can be worked out (see handdist.py)
+    exact = True
+    # set this to False to sample simulation_steps hands for every choice,
+    # instead of stopping once one is clearly best
+    adaptive = True
+    batch_size = 20
+    confidence = 2.0
+
     def __init__(self, cutoff1=2, cutoff2=3, simulation_steps=100):
         self.simulation_steps = simulation_steps
         if not hasattr(self, 'name'):
@@ -38,29 +64,152 @@ class HillClimbBot(BigMoney):
             simulation_steps)
         BigMoney.__init__(self, cutoff1, cutoff2)
 
-    def buy_priority(self, decision, card):
-        state = decision.state()
-        total = 0
+    def buy_value_key(self, state, card):
+        "The key of a card's simulated_buy_value in the cache."
+        if card is None: add = ()
+        else: add = (card,)
+        return (self.__class__, deck_composition(state), add,
+                self.simulation_steps, self.exact)
+
+    def known_buy_value(self, state, card):
+        """
+        The simulated_buy_value of a card, if it's cached or can be worked
+        out exactly, and None if it would have to be sampled.
+        """
+        key = None
+        if self.cache is not None:
+            key = self.buy_value_key(state, card)
+            total = self.cache.get(key)
+            if total is not None: return total
+        if not self.exact: return None
+        if card is None: add = ()
+        else: add = (card,)
+        value = expected_buying_value(state, add)
+        if value is None: return None
+        total = value * self.simulation_steps
+        if key is not None:
+            self.cache[key] = total
+        return total
+
+    def simulated_buy_value(self, state, card):
+        """
+        The total buying value of `simulation_steps` simulated hands after
+        gaining a card. Results are cached by deck composition, because the
+        same decks come up again and again.
+
+        When the deck has no actions with special effects, this is
+        `simulation_steps` times the exact expected value instead, with no
+        sampling noise.
+        """
+        total = self.known_buy_value(state, card)
+        if total is not None: return total
         if card is None: add = ()
         else: add = (card,)
-        for coins, buys in state.simulate_hands(self.simulation_steps, add):
-            total += buying_value(coins, buys)
+        coins, buys = simulate_hands_batch(state, self.simulation_steps, add)
+        total = buying_values(coins, buys).sum()
+        if self.cache is not None:
+            self.cache[self.buy_value_key(state, card)] = total
+        return total
+
+    def bonus(self, card):
+        "Gold is better than it seems."
+        if card == c.gold: return self.simulation_steps/2
+        return 0
 
-        # gold is better than it seems
-        if card == c.gold: total += self.simulation_steps/2
-        self.log.debug("%s: %s" % (card, total))
+    def buy_priority(self, decision, card):
+        total = self.simulated_buy_value(decision.state(), card)
+        total += self.bonus(card)
+        self.log.debug("%s: %s", card, total)
         return total
+
+    def adaptive_buy_priorities(self, decision, choices):
+        """
+        The buy_priority of each choice, as a dictionary, sampling only as
+        many hands as it takes to tell which choice is best.
+
+        Values that are cached or exact are known outright. The rest are
+        sampled `batch_size` hands at a time, and a choice drops out once
+        it is `confidence` standard errors behind the leader. Sampling stops
+        when the leader is clear, when every choice left has had
+        `simulation_steps` hands, or when the decision's budget runs out.
+        The hands sampled for a choice that didn't get all of them are
+        cached too, and the next decision with the same deck starts from
+        them.
+        """
+        state = decision.state()
+        steps = self.simulation_steps
+        known = {}
+        samples = {}
+        for card in choices:
+            total = self.known_buy_value(state, card)
+            if total is not None:
+                known[card] = total + self.bonus(card)
+            elif self.cache is not None:
+                key = self.buy_value_key(state, card) + ('partial',)
+                samples[card] = self.cache.get(key, np.zeros(0, dtype=int))
+            else:
+                samples[card] = np.zeros(0, dtype=int)
+
+        def estimate(card):
+            "The priority of a sampled card, and its standard error."
+            values = samples[card]
+            if not len(values): return self.bonus(card), float('inf')
+            mean = values.mean() * steps + self.bonus(card)
+            if len(values) < 2: return mean, float('inf')
+            return mean, values.std(ddof=1) * steps / np.sqrt(len(values))
+
+        racing = list(samples)
+        budget = decision.budget
+        rounds = 0
+        while any(len(samples[card]) < steps for card in racing):
+            if rounds and budget is not None and budget.expired(): break
+            for card in racing:
+                n = min(self.batch_size, steps - len(samples[card]))
+                if not n: continue
+                if card is None: add = ()
+                else: add = (card,)
+                coins, buys = simulate_hands_batch(state, n, add)
+                samples[card] = np.concatenate([samples[card],
+                                                buying_values(coins, buys)])
+            rounds += 1
+            bounds = {}
+            for card in racing:
+                mean, error = estimate(card)
+                bounds[card] = (mean - self.confidence*error,
+                                mean + self.confidence*error)
+            best = max(known.values() + [low for low, high in bounds.values()])
+            racing = [card for card in racing if bounds[card][1] >= best]
+            contenders = racing + [card for card in known
+                                   if known[card] >= best]
+            if len(contenders) <= 1: break
+
+        priorities = dict(known)
+        for card, values in samples.items():
+            priorities[card] = estimate(card)[0]
+            if self.cache is None: continue
+            key = self.buy_value_key(state, card)
+            if len(values) == steps:
+                # a full sample, as good as simulated_buy_value's
+                self.cache[key] = values.sum()
+            else:
+                self.cache[key + ('partial',)] = values
+        self.log.debug("%s after %d rounds: %s", decision, rounds, priorities)
+        return priorities
     
     def make_buy_decision(self, decision):
         choices = decision.choices()
-        provinces_left = decision.game.card_counts[c.province]
+        provinces_left = decision.game.supply[c.province]
         
         if c.province in choices: return c.province
         if c.duchy in choices and provinces_left <= self.cutoff2:
             return c.duchy
         if c.estate in choices and provinces_left <= self.cutoff1:
             return c.estate
-        return BigMoney.make_buy_decision(self, decision)
+        if not self.adaptive:
+            return BigMoney.make_buy_decision(self, decision)
+        priorities = self.adaptive_buy_priorities(decision, choices)
+        choices.sort(key=priorities.get)
+        return choices[-1]
 
 def buying_value(coins, buys):
     if coins > buys*8: coins = buys*8
@@ -68,3 +217,19 @@ def buying_value(coins, buys):
         coins -= 1
     return coins
 
+def expected_buying_value(state, cards=()):
+    """
+    The exact expected buying_value of a fresh hand from this player's
+    deck, with `cards` on top, or None if the deck has cards that
+    handdist.py can't evaluate.
+    """
+    distribution = hand_distribution(state.deck_counts(), cards)
+    if distribution is None: return None
+    return expectation(distribution, buying_value)
+
+def buying_values(coins, buys):
+    "The vectorized version of buying_value, for arrays of coins and buys."
+    coins = np.minimum(coins, buys*8)
+    leftover = coins - (buys-1)*8
+    return coins - ((leftover == 1) | (leftover == 7))
+
@@ -0,0 +1,262 @@
+"""
+Measure how fast the engine and the bots are.
+
+Every benchmark uses fixed seeds and a fixed kingdom, so runs are
+comparable from one version of the code to the next. Results are written
+as JSON, and can be compared against a saved baseline:
+
+    python benchmark.py -o baseline.json
+    ... change things ...
+    python benchmark.py --compare baseline.json
+"""
+from game import Game, PlayerState, SharedPlayerState, LazyPlayerState, \
+  LazyPile, push_cards
+from basic_ai import SmithyBot, HillClimbBot, buy_value_cache
+from players import BigMoney
+from combobot import ComboBot, IdealistComboBot
+from derivbot import DerivBot
+from handsim import simulate_hands_batch
+from lockstep import LockstepGames
+from mctsbot import MCTSBot
+from collections import OrderedDict
+import cards as c
+import numpy as np
+import json
+import os
+import platform
+import sys
+import time
+
+KINGDOM = c.variable_cards[:10]
+SEED = 12345
+
+def smithy_combo():
+    return ComboBot([(c.smithy, 2), (c.smithy, 6)], name='smithyComboBot')
+
+def chapel_combo():
+    return ComboBot([(c.chapel, 0), (c.laboratory, 0), (c.laboratory, 0),
+                     (c.laboratory, 0), (c.market, 0)],
+                    name='chapelComboBot')
+
+def play_games(make_bots, games, **options):
+    """
+    Play some games between freshly-made bots, and count the games and
+    turns.
+    """
+    buy_value_cache.clear()
+    bots = make_bots()
+    turns = 0
+    for i in xrange(games):
+        game = Game.setup(bots, KINGDOM, shuffle=False, seed=SEED+i,
+                          listeners=(), **options)
+        turns += game.run_to_end().turn
+    return {'games': games, 'turns': turns}
+
+def bench_bigmoney_lockstep(n):
+    games = LockstepGames([BigMoney(), BigMoney()], n, seed=SEED).run()
+    return {'games': n, 'turns': int(games.turns.sum())}
+
+def sample_state(drawpile_size=25, shared=False, lazy=False):
+    """
+    A mid-game deck of 30 cards, with some of them still in the drawpile,
+    as a PlayerState, or a SharedPlayerState if `shared` is True, or a
+    LazyPlayerState if `lazy` is True.
+    """
+    cards = ((c.copper,)*7 + (c.estate,)*3 + (c.silver,)*7 + (c.gold,)*4 +
+             (c.smithy,)*2 + (c.market,)*2 + (c.province,)*3 + (c.duchy,)*2)
+    game = Game.setup([BigMoney()], seed=SEED, listeners=())
+    state = game.state()
+    if lazy:
+        discard = cards[drawpile_size:]
+        return LazyPlayerState(state.player, (),
+                               LazyPile(cards[:drawpile_size], state.rng), 0,
+                               push_cards(discard), len(discard), (),
+                               1, 1, 0, state.rng)
+    if shared:
+        discard = cards[drawpile_size:]
+        return SharedPlayerState(state.player, (), cards[:drawpile_size], 0,
+                                 push_cards(discard), len(discard), (),
+                                 1, 1, 0, state.rng)
+    return PlayerState(state.player, (), cards[:drawpile_size],
+                       cards[drawpile_size:], (), 1, 1, 0, state.rng)
+
+def bench_draw(n, shared=False):
+    state = sample_state(shared=shared)
+    for i in xrange(n):
+        state.draw(5)
+    return {'draws': n}
+
+def bench_draw_reshuffle(n):
+    state = sample_state(drawpile_size=3)
+    for i in xrange(n):
+        state.draw(5)
+    return {'draws': n}
+
+def bench_simulate_hands(n, lazy=False):
+    state = sample_state(lazy=lazy)
+    for i in xrange(n):
+        for coins, buys in state.simulate_hands(100):
+            pass
+    return {'hands': 100*n}
+
+def bench_simulate_hands_batch(n):
+    state = sample_state()
+    for i in xrange(n):
+        simulate_hands_batch(state, 100)
+    return {'hands': 100*n}
+
+def bench_take_turn(n):
+    game = Game.setup([SmithyBot(), BigMoney()], KINGDOM, shuffle=False,
+                      seed=SEED, listeners=())
+    for i in xrange(10):
+        game = game.take_turn()
+    for i in xrange(n):
+        game.take_turn()
+    return {'turns': n}
+
+def bench_combobot_test(n):
+    bot = IdealistComboBot([(c.smithy, 2), (c.smithy, 6)])
+    # the baseline only changes the numbers, not the work, so don't spend
+    # time computing one
+    bot.test(iterations=n, trials=2, seed=SEED, processes=1, width=None,
+             baseline=np.zeros(20))
+    return {'iterations': n}
+
+# Each benchmark is a function of a size parameter, and the size to use in a
+# normal run. A quick run divides the sizes by 10.
+BENCHMARKS = OrderedDict([
+  ('bigmoney', (lambda n: play_games(lambda: [BigMoney(), BigMoney()], n), 100)),
+  ('bigmoney_in_place', (lambda n: play_games(
+      lambda: [BigMoney(), BigMoney()], n, in_place=True), 100)),
+  ('bigmoney_multiset', (lambda n: play_games(
+      lambda: [BigMoney(), BigMoney()], n, multiset=True), 100)),
+  ('bigmoney_shared', (lambda n: play_games(
+      lambda: [BigMoney(), BigMoney()], n, shared=True), 100)),
+  ('bigmoney_lazy', (lambda n: play_games(
+      lambda: [BigMoney(), BigMoney()], n, lazy=True), 100)),
+  ('bigmoney_lockstep', (bench_bigmoney_lockstep, 100000)),
+  ('smithybot', (lambda n: play_games(lambda: [SmithyBot(), BigMoney()], n), 100)),
+  ('hillclimbbot', (lambda n: play_games(
+      lambda: [HillClimbBot(2, 3, 40), BigMoney()], n), 10)),
+  ('combobots', (lambda n: play_games(
+      lambda: [smithy_combo(), chapel_combo()], n), 50)),
+  ('derivbot', (lambda n: play_games(lambda: [DerivBot(2), BigMoney()], n), 2)),
+  ('mctsbot', (lambda n: play_games(
+      lambda: [MCTSBot(iterations=20), BigMoney()], n), 2)),
+  ('draw', (bench_draw, 20000)),
+  ('draw_shared', (lambda n: bench_draw(n, shared=True), 20000)),
+  ('draw_reshuffle', (bench_draw_reshuffle, 5000)),
+  ('simulate_hands', (bench_simulate_hands, 20)),
+  ('simulate_hands_lazy', (lambda n: bench_simulate_hands(n, lazy=True), 20)),
+  ('simulate_hands_batch', (bench_simulate_hands_batch, 200)),
+  ('take_turn', (bench_take_turn, 2000)),
+  ('combobot_test', (bench_combobot_test, 10)),
+])
+
+class Silence(object):
+    "Throw away anything the bots write to stdout."
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+    def __exit__(self, *exc):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+def run_benchmark(func, size, repeat=3):
+    """
+    Run a benchmark `repeat` times, and report the fastest run: its time in
+    seconds, the counts it returned, and a rate per second for each count.
+    """
+    best = None
+    for i in xrange(repeat):
+        with Silence():
+            start = time.time()
+            counts = func(size)
+            elapsed = time.time() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, counts)
+    elapsed, counts = best
+    result = {'seconds': elapsed}
+    for key, count in counts.items():
+        result[key] = count
+        result[key + '_per_sec'] = count / max(elapsed, 1e-9)
+    return result
+
+def run_all(names=None, quick=False, repeat=3, report=None):
+    results = OrderedDict()
+    for name, (func, size) in BENCHMARKS.items():
+        if names and name not in names: continue
+        if quick: size = max(size // 10, 1)
+        results[name] = run_benchmark(func, size, repeat)
+        if report is not None: report(name, results[name])
+    return {'python': platform.python_version(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'quick': quick,
+            'benchmarks': results}
+
+def rates(result):
+    return sorted((key, value) for key, value in result.items()
+                  if key.endswith('_per_sec'))
+
+def format_result(name, result):
+    return '%-22s %8.3fs  %s' % (name, result['seconds'], '  '.join(
+      '%s=%.1f' % (key, value) for key, value in rates(result)
+    ))
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Compare benchmark results against a baseline. Returns a list of lines
+    describing the changes in every rate, and the number of regressions:
+    rates that dropped by more than `threshold`.
+    """
+    lines = []
+    regressions = 0
+    for name, result in results['benchmarks'].items():
+        if name not in baseline['benchmarks']: continue
+        old = baseline['benchmarks'][name]
+        for key, value in rates(result):
+            if key not in old: continue
+            change = value / old[key] - 1.0
+            flag = ''
+            if change < -threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            lines.append('%-22s %-20s %10.1f -> %10.1f  %+6.1f%%%s' % (
+              name, key, old[key], value, 100*change, flag
+            ))
+    return lines, regressions
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark dominiate.')
+    parser.add_argument('names', nargs='*', metavar='BENCHMARK',
+      help='benchmarks to run (default: all of %s)' % ', '.join(BENCHMARKS))
+    parser.add_argument('-o', '--output', help='write results to this file')
+    parser.add_argument('--compare', metavar='BASELINE',
+      help='compare against results saved with -o')
+    parser.add_argument('--quick', action='store_true',
+      help='run one tenth of the usual work')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=0.1,
+      help='fractional slowdown that counts as a regression')
+    args = parser.parse_args(argv)
+
+    def report(name, result):
+        print >> sys.stderr, format_result(name, result)
+    results = run_all(args.names, args.quick, args.repeat, report)
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(results, out, indent=2)
+    else:
+        print json.dumps(results, indent=2)
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)
+        lines, regressions = compare(results, baseline, args.threshold)
+        print >> sys.stderr, '\n'.join(lines)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+A bounded least-recently-used cache, for remembering the results of
+expensive simulations.
+"""
+from collections import OrderedDict
+
+class LRUCache(object):
+    """
+    A dictionary-like cache that holds at most `maxsize` entries, throwing
+    away the least recently used ones when it fills up. It keeps count of
+    hits and misses.
+
+    A cache that is stored at module level is shared by everything in the
+    process, so results are reused across games in a tournament worker.
+    """
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.data.pop(key, None)
+        self.data[key] = value
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if not lookups: return 0.0
+        return float(self.hits) / lookups
+
+    def stats(self):
+        return {'size': len(self.data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate()}
+
+    def __repr__(self):
+        return '<LRUCache: %d/%d entries, %d hits, %d misses (%.1f%%)>' % (
+          len(self.data), self.maxsize, self.hits, self.misses,
+          100*self.hit_rate()
+        )
@@ -9,30 +9,30 @@ festival = Card('Festival', 5, coins=2, actions=2, buys=1)
 market = Card('Market', 5, coins=1, cards=1, actions=1, buys=1)
 laboratory = Card('Laboratory', 5, cards=2, actions=1)
 
+# Effects that involve decisions are step generators (see game.run_steps):
+# they yield each Decision, are sent the resulting game, and finally yield
+# the game they end with.
+
 def chapel_action(game):
-    newgame = game.current_player().make_decision(
-        TrashDecision(game, 0, 4)
-    )
-    return newgame
+    newgame = yield TrashDecision(game, 0, 4)
+    yield newgame
 
 def cellar_action(game):
-    newgame = game.current_player().make_decision(
-        DiscardDecision(game)
-    )
-    card_diff = game.state().hand_size() - newgame.state().hand_size()
-    return newgame.replace_current_state(newgame.state().draw(card_diff))
+    # remember the hand size first, in case the game changes in place
+    hand_size = game.state().hand_size()
+    newgame = yield DiscardDecision(game)
+    card_diff = hand_size - newgame.state().hand_size()
+    yield newgame.replace_current_state(newgame.state().draw(card_diff))
 
 def warehouse_action(game):
-    newgame = game.current_player().make_decision(
-        DiscardDecision(game, 3, 3)
-    )
-    return newgame
+    newgame = yield DiscardDecision(game, 3, 3)
+    yield newgame
 
 def council_room_action(game):
     return game.change_other_states(delta_cards=1)
 
 def militia_attack(game):
-    return game.attack_with_decision(
+    return game.attack_steps(
         lambda g: DiscardDecision(g, 2, 2)
     )
 
@@ -12,51 +12,45 @@
 # after being run for the same number of turns.
 
 from basic_ai import BigMoney
+from baseline import baseline_curve, state_value
 from game import Game
+from tournament import WorkerPool
 import cards as c
 import numpy as np
+import logging
+import math
+import random
 
 def deck_value(deck):
     return sum([card.cost for card in deck]) - len(deck)
 
-def big_money_baseline():
-    improvements = np.zeros((30,))
-    counts = np.zeros((30,), dtype='int32')
-    for iteration in xrange(10000):
-        game = Game.setup([BigMoney(1, 2)])
-        for turn in xrange(30):
-            before_value = deck_value(game.state().all_cards())
-            game = game.take_turn()
-            after_value = deck_value(game.state().all_cards())
-            delta = after_value - before_value
-            improvements[turn] += delta
-            counts[turn] += 1
-            if game.over(): break
-        avg = [imp/count for imp, count in zip(improvements, counts)]
-        print avg
-        print counts
-    return avg
-
-# precalculated; easier than loading a pickle or something
-baseline = np.array(
-   [1.8226, 1.8302, 2.4849, 2.5363, 3.2383, 3.6883, 3.9152, 4.4961,
-    4.5271, 4.8773, 4.9464, 4.9591, 5.0117, 5.2145, 5.2473, 5.2609,
-    5.1505, 5.1500, 5.2662, 5.4229]
-)
+def big_money_baseline(turns=20):
+    """
+    How much BigMoney(1, 2) improves its deck on each turn, with the kingdom
+    cards that IdealistComboBot.test uses. See baseline.py; the curve is
+    computed once and then cached on disk.
+    """
+    return baseline_curve(BigMoney(1, 2), c.variable_cards, turns)
 
 class IdealistComboBot(BigMoney):
     def __init__(self, strategy, name=None):
         self.strategy = strategy
-        self.strategy_on = True
-        self.strategy_complete = False
         if name is None:
             self.name = 'IdealistComboBot(%s)' % (strategy)
         else:
             self.name = name
         BigMoney.__init__(self, 1, 2)
     
-    def before_turn(self, game):
-        current_cards = game.state().all_cards()
+    def strategy_status(self, game):
+        """
+        Compare the current player's deck in `game` with the strategy.
+        Returns the cards that are still needed by this round, least
+        needed first, and whether the strategy is complete.
+
+        This is worked out from the game each time, not kept on the bot,
+        so one bot can play many games at once (see driver.run_games).
+        """
+        state = game.state()
         priority = []
         needed = {}
         pending = False
@@ -67,64 +61,138 @@ class IdealistComboBot(BigMoney):
             else:
                 pending = True
         for card in needed:
-            needed[card] -= current_cards.count(card)
+            needed[card] -= state.deck_count(card)
             if needed[card] > 0: priority.append(card)
 
         priority.sort(key=lambda card: (needed[card], card.cost))
-        self.strategy_priority = priority
-        self.log.debug('Strategy: %s' % self.strategy_priority)
-        self.strategy_on = bool(priority)
-        self.strategy_complete = not (priority or pending)
+        return priority, not (priority or pending)
     
     def buy_priority_order(self, decision):
-        if self.strategy_complete:
+        priority, complete = self.strategy_status(decision.game)
+        if complete:
             return BigMoney.buy_priority_order(self, decision)
         else:
-            return [None, c.silver, c.gold, c.province] + self.strategy_priority
+            return [None, c.silver, c.gold, c.province] + priority
 
     def make_buy_decision(self, decision):
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug('Strategy: %s',
+                           self.strategy_status(decision.game)[0])
         choices = decision.choices()
         choices.sort(key=lambda x: self.buy_priority(decision, x))
         return choices[-1]
     
-    def test(self):
+    def test(self, iterations=100, trials=10, seed=None, processes=None,
+             width=0.2, min_iterations=20, baseline=None):
+        """
+        Estimate how much faster this strategy improves its deck than
+        BigMoney does, by playing up to `iterations` solitaire games up to the
+        point where the strategy is complete, and then testing `trials` turns
+        from there. Use `seed` to make the games repeatable.
+
+        The games are played on a pool of `processes` worker processes (by
+        default, one per CPU; 1 plays them in this process). Testing stops
+        early, after at least `min_iterations` games, once the 95% confidence
+        interval on the overall gain, worked out from each game's mean gain,
+        is narrower than `width`. Pass
+        `width=None` to always play every game.
+
+        `baseline` is the curve to compare against, which defaults to
+        big_money_baseline().
+        """
+        if seed is None:
+            seed = random.randrange(2**31)
+        if baseline is None:
+            baseline = big_money_baseline()
         improvements = np.zeros((30,))
         counts = np.zeros((30,), dtype='int32')
-        for iteration in xrange(100):
-            game = Game.setup([self], c.variable_cards, simulated=False)
-            turn_count = 0
-            # Find a state where the strategy is done and the deck is
-            # about to be shuffled
-            while not (game.card_counts[c.province] <= 1 or
-                       (game.current_player().strategy_complete and 
-                        len(game.state().drawpile) < 5)):
-                game = game.take_turn()
-                turn_count += 1
-                assert game.round == turn_count
-            if turn_count <= 18:
-                for trial in xrange(10):
-                    # take one more turn to shuffle the deck
-                    game1 = game.take_turn()
-                    # test the next turn
-                    before_value = deck_value(game1.state().all_cards())
-                    game2 = game1.take_turn()
-                    after_value = deck_value(game2.state().all_cards())
-                    improvements[turn_count+1] +=\
-                      (after_value - before_value - baseline[turn_count+1])
-                    counts[turn_count+1] += 1
-            avg = improvements/counts
-            overall = np.sum(improvements)/np.sum(counts)
-            self.log.info(str(overall))
-            self.log.info('\n%s' % avg)
+        # running totals of each game's mean gain, for the confidence
+        # interval; the trials of one game share its deck, so they aren't
+        # independent, but the games are
+        total = squares = 0.0
+        games = 0
+        seeds = xrange(seed, seed + iterations)
+
+        pool = WorkerPool(processes, _init_test_worker,
+                          (self, trials, baseline))
+        # in seed order, so where testing stops only depends on the seed
+        results = pool.imap(test_iteration, seeds)
+        try:
+            for done, (turn, gains) in enumerate(results, 1):
+                for gain in gains:
+                    improvements[turn] += gain
+                    counts[turn] += 1
+                if gains:
+                    game_mean = float(sum(gains)) / len(gains)
+                    total += game_mean
+                    squares += game_mean * game_mean
+                    games += 1
+                if width is None or done < min_iterations or games < 2:
+                    continue
+                mean = total / games
+                variance = (squares - games * mean * mean) / (games - 1)
+                if 2 * 1.96 * math.sqrt(max(variance, 0.0) / games) < width:
+                    self.log.info('Converged after %d games', done)
+                    break
+        finally:
+            pool.close()
+        overall = np.sum(improvements)/np.sum(counts)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.log.info('\n%s' % (improvements/counts))
         self.log.info('Overall gain: %s' % overall)
         return overall
 
+# The bot that test_iteration tests in this process, how many trials to run,
+# and the baseline to compare with. They're set when a worker process
+# starts, instead of being sent along with every game.
+_test_bot = None
+_test_trials = None
+_test_baseline = None
+
+def _init_test_worker(bot, trials, baseline):
+    global _test_bot, _test_trials, _test_baseline
+    _test_bot = bot
+    _test_trials = trials
+    _test_baseline = baseline
+
+def test_iteration(game_seed):
+    """
+    Play one game of IdealistComboBot.test. Returns the turn that was
+    tested, and a list of how much each trial of that turn improved the deck
+    over the baseline; the list is empty if the strategy took too long.
+    """
+    game = Game.setup([_test_bot], c.variable_cards, simulated=False,
+                      seed=game_seed, listeners=())
+    turn_count = 0
+    # Find a state where the strategy is done and the deck is
+    # about to be shuffled. Give up after turn 18, because some strategies
+    # (such as trashing everything with a Chapel) never get there.
+    while not (game.supply[c.province] <= 1 or turn_count > 18 or
+               (_test_bot.strategy_status(game)[1] and
+                game.state().drawpile_size() < 5)):
+        game = game.take_turn()
+        turn_count += 1
+        assert game.round == turn_count
+    gains = []
+    if turn_count <= 18:
+        for trial in xrange(_test_trials):
+            # take one more turn to shuffle the deck
+            game1 = game.take_turn()
+            # test the next turn
+            before_value = state_value(game1.state())
+            game2 = game1.take_turn()
+            after_value = state_value(game2.state())
+            gains.append(after_value - before_value -
+                         _test_baseline[turn_count+1])
+    return turn_count + 1, gains
+
 class ComboBot(IdealistComboBot):
     def buy_priority_order(self, decision):
-        if self.strategy_complete:
+        priority, complete = self.strategy_status(decision.game)
+        if complete:
             return BigMoney.buy_priority_order(self, decision)
         else:
-            return [None, c.silver] + self.strategy_priority + [c.gold, c.province]
+            return [None, c.silver] + priority + [c.gold, c.province]
 
 
 smithyComboBot = ComboBot([(c.smithy, 2), (c.smithy, 6)],
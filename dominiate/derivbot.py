@@ -2,7 +2,10 @@ from collections import defaultdict
 from game import BuyDecision, ActDecision, Game
 from players import Player
 from basic_ai import HillClimbBot
+from handsim import simulate_swaps
 import cards as c
+import numpy as np
+import logging
 
 class DerivBot(HillClimbBot):
     """
@@ -28,6 +31,13 @@ class DerivBot(HillClimbBot):
                     value += cardval
                     break
         return value
+    def buy_values(self, coins, buys, order):
+        "Vectorized buy_value, for arrays of coins and buys."
+        pairs = np.column_stack([coins, buys])
+        unique, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        values = np.array([self.buy_value(coin, buy, order)
+                           for coin, buy in unique], dtype=float)
+        return values[inverse.ravel()]
     def update_values(self, game):
         # 0th order and initialization
         for card in game.card_choices():
@@ -38,52 +48,51 @@ class DerivBot(HillClimbBot):
 
         avg_hand_size = 0.0
         avg_provinces = 0.0
+        choices = game.card_choices()
         for deriv in (1, 2):
             prev_order = sorted(self.values[deriv-1].items(), key=lambda x: -x[1])
             for iter in xrange(self.k):
-                game = Game([game.state().simulation_state()],
-                             game.card_counts, 0, simulated=True)
-                state = game.simulate_partial_turn()
+                simgame = Game([game.state().simulation_state()],
+                               game.supply.copy(), 0, simulated=True)
+                state = simgame.simulate_partial_turn()
                 hand = state.tableau + state.hand
-                
+
+                # Play the hand as it is, and with each card swapped in for
+                # each card in it, all in one batch.
+                coins, buys = simulate_swaps(state, hand, choices)
+                values = self.buy_values(coins, buys, prev_order)
                 # How much is the hand worth without changing anything?
-                actual_value = 0
-                for coins, buys in state.simulate_hands(1, hand):
-                    actual_value = self.buy_value(coins, buys, prev_order)
-                if coins >= 8:
+                actual_value = values[0]
+                if coins[0] >= 8:
                     avg_provinces += 1.0 / self.k / 2
 
                 n = len(hand)
                 avg_hand_size += float(n) / self.k / 2
-                for card in game.card_choices():
-                    for i in range(len(hand)):
-                        newhand = hand[:i] + (card,) + hand[i+1:]
-
-                        # Only one simulation step will be necessary, most of the time.
-                        # The only variance comes in if we draw extra cards.
-                        for coins, buys in state.simulate_hands(1, newhand):
-                            value = self.buy_value(coins, buys, prev_order) - actual_value
-                            self.values[deriv][card] += float(value) / self.k / n
+                # an empty hand has no cards to swap, and nothing to learn
+                if not n: continue
+                swaps = (values[1:] - actual_value).reshape(len(choices), n)
+                for card, gains in zip(choices, swaps.sum(axis=1)):
+                    self.values[deriv][card] += gains / self.k / n
                 # TODO: take into account cards you gain/trash
-        
+
         # turns_left = provinces_left / (provinces/turn)
         if avg_provinces == 0.0: avg_provinces = 0.1
-        turns_left_in_game = (game.card_counts[c.province] /
+        turns_left_in_game = (game.supply[c.province] /
           ((avg_provinces+0.5) * game.num_players()))
-        print "Estimated turns left:", turns_left_in_game
+        self.log.debug("Estimated turns left: %s", turns_left_in_game)
 
         # reshuffles = (cards/turn) / (cards/deck) * turns_left
-        reshuffles_left = (avg_hand_size / len(game.state().all_cards()) *
+        reshuffles_left = (avg_hand_size / game.state().deck_size() *
           turns_left_in_game)
 
         # compensate for cards in deck
         reshuffles_left -= \
-          float(len(game.state().drawpile)) / game.state().deck_size()
+          float(game.state().drawpile_size()) / game.state().deck_size()
         
         factors = [1.0, 0.0, 0.0]
         factors[1] = max(reshuffles_left, 0)
         factors[2] = max(reshuffles_left * (reshuffles_left-1)/2, 0)
-        print "%12s  % 7.3f % 7.3f % 7.3f" % (('',) + tuple(factors))
+        self.log.debug("%12s  % 7.3f % 7.3f % 7.3f", *(('',) + tuple(factors)))
         for card in game.card_choices():
             weighted_values = [0, 0, 0]
             for order in range(3):
@@ -105,10 +114,11 @@ class DerivBot(HillClimbBot):
                 # So add another 12 for good measure.
                 totalvalue += 12.0
             self.current_values[card] = totalvalue
-            print "%12s: % 7.3f % 7.3f % 7.3f  % 7.3f % 7.3f % 7.3f % 7.3f" %\
-              (card, self.values[0][card], self.values[1][card], 
-               self.values[2][card], self.averages[0][card],
-               self.averages[1][card], self.averages[2][card], totalvalue)
+            self.log.debug(
+              "%12s: % 7.3f % 7.3f % 7.3f  % 7.3f % 7.3f % 7.3f % 7.3f",
+              card, self.values[0][card], self.values[1][card],
+              self.values[2][card], self.averages[0][card],
+              self.averages[1][card], self.averages[2][card], totalvalue)
         self.samples += 1
 
     def buy_priority(self, decision, card):
@@ -116,10 +126,11 @@ class DerivBot(HillClimbBot):
         else: return self.current_values[card]
     
     def make_buy_decision(self, decision):
-        print "BuyDecision (%d coins): hand is %s" % (
-          decision.state().hand_value(), decision.state().hand
-        )
-        print "Deck is now:", sorted(decision.game.state().all_cards())
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("BuyDecision (%d coins): hand is %s",
+                           decision.state().hand_value(), decision.state().hand)
+            self.log.debug("Deck is now: %s",
+                           sorted(decision.game.state().all_cards()))
         choices = decision.choices()
         choices.sort(key=lambda x: self.buy_priority(decision, x))
         return choices[-1]
@@ -3,23 +3,22 @@ from players import *
 from basic_ai import *
 from combobot import *
 from cards import variable_cards
-from collections import defaultdict
-import random
+from tournament import run_tournament
+from store import ResultStore
 
-def compare_bots(bots):
-    scores = defaultdict(int)
-    for i in xrange(50):
-        random.shuffle(bots)
-        game = Game.setup(bots, variable_cards)
-        results = game.run()
-        maxscore = 0
-        for bot, score in results:
-            if score > maxscore: maxscore = score
-        for bot, score in results:
-            if score == maxscore:
-                scores[bot] += 1
-                break
-    return scores
+def compare_bots(bots, games=50, processes=None, store=None):
+    """
+    Play a number of games between some bots, and return a dictionary of
+    how many games each bot won, where a tied game goes to the tied bot
+    that went first. See tournament.py for more detailed results.
+
+    If `store` is a directory name, the result of every game is saved
+    there, and an interrupted comparison can be resumed (see store.py).
+    """
+    if store is not None:
+        store = ResultStore(store, [bot.name for bot in bots])
+    return run_tournament(bots, games, processes, store=store).win_counts(
+      break_ties=True)
 
 def test_game():
     player1 = smithyComboBot
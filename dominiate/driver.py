@@ -0,0 +1,115 @@
+"""
+Play games one decision at a time, so that many games can run at once.
+
+Normally a game asks each player for a decision and waits for the answer,
+so a bot with an expensive evaluator holds up the whole game. A GameDriver
+instead runs a game until it needs a decision, and then hands the Decision
+back to whoever is driving it:
+
+    driver = GameDriver(game)
+    while not driver.done():
+        driver.choose(pick_something(driver.decision))
+    print [state.score() for state in driver.game.playerstates]
+
+run_games uses this to interleave many games in one process. All the
+decisions that are waiting in every game are collected, and each player
+gets its decisions as a single batch through Player.make_decisions, so a
+bot can evaluate them all together. AIPlayers answer with their choices,
+which the driver carries out a step at a time, so the decisions that a
+card's effect leads to -- what to trash with a Chapel, what to discard to
+a Militia -- come back to the driver and are batched like the rest.
+
+A player that sits in several of the games at once sees their decisions
+interleaved, so it must not keep the state of a game on itself. The turn
+hooks, before_turn and after_turn, are for exactly that kind of state, so
+run_games won't share a player that overrides them between games.
+"""
+from game import Decision, flatten_steps
+from players import Player
+from collections import OrderedDict
+
+class GameDriver(object):
+    """
+    A game in progress that is waiting for a decision, or has finished.
+
+    `decision` is the Decision that is waiting to be made, or None once
+    the game is over, when `game` is the final Game.
+    """
+    def __init__(self, game):
+        self.steps = flatten_steps(game.game_steps())
+        self.decision = None
+        self.game = None
+        self._advance(self.steps.next())
+
+    def _advance(self, item):
+        if isinstance(item, Decision):
+            self.decision = item
+        else:
+            self.decision = None
+            self.game = item
+            self.steps.close()
+
+    def done(self):
+        return self.decision is None
+
+    def choose(self, choice):
+        """
+        Make the waiting decision, and run the game until the next one.
+        `choice` is what the Decision's choose() method takes, or the Game
+        that results from the decision.
+        """
+        if self.done(): raise ValueError("The game is over")
+        self._advance(self.steps.send(choice))
+
+    def decide(self):
+        "Let the player the waiting decision belongs to make it."
+        self.choose(self.decision.player().make_decisions([self.decision])[0])
+
+def has_turn_hooks(player):
+    "Whether a player overrides Player.before_turn or Player.after_turn."
+    for hook in ('before_turn', 'after_turn'):
+        if (getattr(type(player), hook).__func__ is not
+            getattr(Player, hook).__func__):
+            return True
+    return False
+
+def check_players(games):
+    """
+    Raise a ValueError if a player with turn hooks sits in more than one
+    of `games`, since its hooks would see the games' turns interleaved.
+    """
+    seen = set()
+    for game in games:
+        players = set(state.player for state in game.playerstates)
+        for player in players:
+            if player in seen and has_turn_hooks(player):
+                raise ValueError("%s keeps state between turns, so it can't "
+                                 "play several games at once; give each "
+                                 "game its own instance" % player)
+        seen.update(players)
+
+def run_games(games):
+    """
+    Play a number of games to the end, interleaved, and return the final
+    Games in the same order.
+
+    On each round, every game that is waiting for a decision is grouped by
+    the player that has to make it, and each player makes all its
+    decisions at once with make_decisions(). A player can sit in any
+    number of the games, unless it has turn hooks (see check_players).
+    """
+    check_players(games)
+    drivers = [GameDriver(game) for game in games]
+    waiting = [driver for driver in drivers if not driver.done()]
+    while waiting:
+        by_player = OrderedDict()
+        for driver in waiting:
+            player = driver.decision.player()
+            by_player.setdefault(player, []).append(driver)
+        for player, group in by_player.items():
+            replies = player.make_decisions([driver.decision
+                                             for driver in group])
+            for driver, reply in zip(group, replies):
+                driver.choose(reply)
+        waiting = [driver for driver in waiting if not driver.done()]
+    return [driver.game for driver in drivers]
@@ -0,0 +1,102 @@
+"""
+Listeners for the things that happen in a game.
+
+A Game has a tuple of listeners, and calls the appropriate method on each of
+them when a turn starts, a card is played, bought, trashed or discarded,
+and when the game ends. When there are no listeners -- as in simulations,
+tournaments and benchmarks -- this costs no more than looping over an empty
+tuple, and no log messages are formatted unless someone will read them.
+"""
+from collections import defaultdict
+import logging
+
+class GameListener(object):
+    """
+    The interface for game events. Subclasses override the events they care
+    about; the rest do nothing.
+    """
+    def turn_start(self, game):
+        pass
+
+    def play(self, game, player, card):
+        pass
+
+    def buy(self, game, player, card):
+        pass
+
+    def trash(self, game, player, cards):
+        pass
+
+    def discard(self, game, player, cards):
+        pass
+
+    def game_end(self, game):
+        pass
+
+class LoggingListener(GameListener):
+    """
+    Describes the game in the 'Game' log at the INFO level. Games that are
+    set up without a list of listeners use one of these.
+    """
+    def __init__(self, logid='Game', level=logging.INFO):
+        self.log = logging.getLogger(logid)
+        self.log.setLevel(level)
+
+    def turn_start(self, game):
+        self.log.info("")
+        self.log.info("Round %d / player %d: %s", game.round + 1,
+                      game.player_turn + 1, game.current_player().name)
+        self.log.info("%d provinces left", game.provinces_left())
+
+    def play(self, game, player, card):
+        self.log.info("%s plays %s", player.name, card)
+
+    def buy(self, game, player, card):
+        self.log.info("%s buys %s", player.name, card)
+
+    def trash(self, game, player, cards):
+        self.log.info("%s trashes %s", player.name, cards)
+
+    def discard(self, game, player, cards):
+        self.log.info("%s discards %s", player.name, cards)
+
+    def game_end(self, game):
+        self.log.info("End of game.")
+        self.log.info("Scores: %s", [(state.player, state.score())
+                                     for state in game.playerstates])
+
+class EventCounter(GameListener):
+    """
+    Counts the events in one or more games: games and turns in total, and
+    plays, buys, trashes and discards for each card.
+    """
+    def __init__(self):
+        self.games = 0
+        self.turns = 0
+        self.plays = defaultdict(int)
+        self.buys = defaultdict(int)
+        self.trashes = defaultdict(int)
+        self.discards = defaultdict(int)
+
+    def turn_start(self, game):
+        self.turns += 1
+
+    def play(self, game, player, card):
+        self.plays[card] += 1
+
+    def buy(self, game, player, card):
+        self.buys[card] += 1
+
+    def trash(self, game, player, cards):
+        for card in cards:
+            self.trashes[card] += 1
+
+    def discard(self, game, player, cards):
+        for card in cards:
+            self.discards[card] += 1
+
+    def game_end(self, game):
+        self.games += 1
+
+    def __repr__(self):
+        return '<EventCounter: %d games, %d turns>' % (self.games, self.turns)
@@ -1,17 +1,95 @@
 import random
 import logging
-mainLog = logging.getLogger(__name__)
+from itertools import izip_longest
+import numpy as np
+from events import LoggingListener
 logging.basicConfig(level=logging.WARN)
 
 INF = ()
 
+# Columns of the card table; see CardRegistry.table().
+COST, TREASURE, VP, CARDS, ACTIONS, BUYS, COINS = range(7)
+
+class CardRegistry(object):
+    """
+    Keeps track of every Card that has been constructed, giving each one a
+    dense integer ID (its `index`). This lets decks be represented as vectors
+    of counts, and lets vectorized code look up card properties in a NumPy
+    table instead of going through Card objects.
+    """
+    columns = ('cost', 'treasure', 'vp', 'cards', 'actions', 'buys', 'coins')
+
+    def __init__(self):
+        self.cards = []
+        self._table = None
+
+    def register(self, card):
+        "Assign the next ID to a card."
+        card.index = len(self.cards)
+        self.cards.append(card)
+        self._table = None
+
+    def __getitem__(self, index):
+        return self.cards[index]
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def by_name(self, name):
+        for card in self.cards:
+            if card.name == name: return card
+        raise KeyError(name)
+
+    def table(self):
+        """
+        Get an array with one row per card, in order of ID, and one column
+        for each of the properties in `columns`. The column indices are
+        available as the constants COST, TREASURE, VP, CARDS, ACTIONS, BUYS
+        and COINS.
+        """
+        if self._table is None:
+            self._table = np.array(
+              [[getattr(card, column) for column in self.columns]
+               for card in self.cards], dtype='int32'
+            ).reshape((len(self.cards), len(self.columns)))
+        return self._table
+
+    def column(self, column):
+        "Get one column of the card table, such as registry.column(TREASURE)."
+        return self.table()[:, column]
+
+    def flags(self):
+        """
+        Get boolean arrays of which cards are actions, treasures, victory
+        cards and attacks, in that order.
+        """
+        return (np.array([card.is_action for card in self.cards]),
+                np.array([card.is_treasure for card in self.cards]),
+                np.array([card.is_victory for card in self.cards]),
+                np.array([card.is_attack for card in self.cards]))
+
+registry = CardRegistry()
+ALL_CARDS = registry.cards
+
 class Card(object):
     """
     Represents a class of card.
 
     To save computation, only one of each card should be constructed. Decks can
     contain many references to the same Card object.
+
+    The type of a card (action, treasure, victory, attack) is worked out once,
+    when the card is constructed, and stored in the `is_action`,
+    `is_treasure`, `is_victory` and `is_attack` attributes.
     """
+    __slots__ = ('name', 'cost', 'potionCost', 'treasure', 'vp', 'coins',
+                 'cards', 'actions', 'buys', 'effect', 'reaction', 'duration',
+                 'index', 'is_action', 'is_treasure', 'is_victory',
+                 'is_curse', 'is_attack', 'is_defense')
+
     def __init__(self, name, cost, treasure=0, vp=0, coins=0, cards=0,
                  actions=0, buys=0, potionCost=0, effect=(), isAttack=False,
                  isDefense=False, reaction=(), duration=()):
@@ -30,8 +108,6 @@ class Card(object):
         self.cards = cards
         self.actions = actions
         self.buys = buys
-        self._isAttack = isAttack
-        self._isDefense = isDefense
         if not isinstance(effect, (tuple, list)):
             self.effect = (effect,)
         else:
@@ -39,27 +115,35 @@ class Card(object):
         self.reaction = reaction
         self.duration = duration
 
+        self.is_action = bool(coins or cards or actions or buys or
+                              self.effect)
+        self.is_treasure = self.treasure > 0
+        self.is_victory = self.vp > 0
+        self.is_curse = self.vp < 0
+        self.is_attack = isAttack
+        self.is_defense = isDefense
+        registry.register(self)
+
     def isVictory(self):
-        return self.vp > 0
+        return self.is_victory
 
     def isCurse(self):
-        return self.vp < 0
+        return self.is_curse
 
     def isTreasure(self):
-        return self.treasure > 0
+        return self.is_treasure
 
     def isAction(self):
-        return (self.coins or self.cards or self.actions or self.buys or
-                self.effect)
+        return self.is_action
 
     def isAttack(self):
-        return self._isAttack
+        return self.is_attack
 
     def isDefense(self):
-        return self._isDefense
+        return self.is_defense
 
     def perform_action(self, game):
-        assert self.isAction()
+        assert self.is_action
         if self.cards:
             game = game.current_draw_cards(self.cards)
         if (self.coins or self.actions or self.buys):
@@ -70,15 +154,43 @@ class Card(object):
             )
         for action in self.effect:
             game = action(game)
+            if not isinstance(game, Game):
+                game = run_steps(game)
         return game
 
+    def action_steps(self, game):
+        """
+        The steps of performing this card's action, for games that are
+        driven one decision at a time (see run_steps).
+        """
+        assert self.is_action
+        if self.cards:
+            game = game.current_draw_cards(self.cards)
+        if (self.coins or self.actions or self.buys):
+            game = game.change_current_state(
+              delta_coins=self.coins,
+              delta_actions=self.actions,
+              delta_buys=self.buys
+            )
+        for action in self.effect:
+            result = action(game)
+            if isinstance(result, Game): game = result
+            else: game = yield result
+        yield game
+
     def __str__(self): return self.name
+    # Cards sort by cost and name, but two cards are only equal if they are
+    # the same card, which matches the hash.
     def __cmp__(self, other):
         if other is None: return -1
         return cmp((self.cost, self.name), 
                    (other.cost, other.name))
+    def __eq__(self, other):
+        return isinstance(other, Card) and self.index == other.index
+    def __ne__(self, other):
+        return not self.__eq__(other)
     def __hash__(self):
-        return hash(self.name)
+        return self.index
     def __repr__(self): return self.name
 
 # define the cards that are in every game
@@ -91,13 +203,108 @@ copper = Card('Copper', 0, treasure=1)
 silver = Card('Silver', 3, treasure=2)
 gold   = Card('Gold', 6, treasure=3)
 
+class GameRandom(random.Random):
+    """
+    A random number generator for one player's deck in one game.
+
+    Simulations that the player runs draw from a separate stream,
+    `simulation`, so that looking ahead doesn't change the shuffles that
+    happen in the real game. This way, two bots playing from the same seed
+    see the same shuffles, no matter how much they simulate.
+    """
+    def __init__(self, seed=None):
+        random.Random.__init__(self, seed)
+        self.simulation = random.Random(self.getrandbits(64))
+
+def simulation_rng(rng):
+    "Get the random number generator that simulations from `rng` should use."
+    return getattr(rng, 'simulation', rng)
+
+class DeckStats(object):
+    """
+    Running totals over a player's whole deck: its size, its victory points,
+    its treasure, the +coins on its actions, the total cost of its cards,
+    and a count of each card, indexed by Card.index.
+
+    Drawing, playing and discarding only move cards around within the deck,
+    so they leave these totals alone. Gaining or trashing a card updates
+    them without looking at the cards in the deck. plus() and minus() copy
+    the count vector, though, so they take time proportional to the number
+    of registered cards (a few dozen), not to the size of the deck; add()
+    changes the stats in place in constant time.
+    """
+    __slots__ = ('size', 'vp', 'treasure', 'coins', 'cost', 'counts')
+
+    def __init__(self, size=0, vp=0, treasure=0, coins=0, cost=0, counts=None):
+        self.size = size
+        self.vp = vp
+        self.treasure = treasure
+        self.coins = coins
+        self.cost = cost
+        if counts is None:
+            counts = [0] * len(ALL_CARDS)
+        self.counts = counts
+
+    @staticmethod
+    def of(cards):
+        stats = DeckStats()
+        for card in cards:
+            stats.add(card)
+        return stats
+
+    @staticmethod
+    def of_counts(counts):
+        """
+        Make stats out of a NumPy vector of card counts, indexed by
+        Card.index, using the card table.
+        """
+        sums = counts.dot(registry.table()[:len(counts)])
+        return DeckStats(int(counts.sum()), int(sums[VP]), int(sums[TREASURE]),
+                         int(sums[COINS]), int(sums[COST]), counts.tolist())
+
+    def copy(self):
+        return DeckStats(self.size, self.vp, self.treasure, self.coins,
+                         self.cost, list(self.counts))
+
+    def add(self, card, sign=1):
+        "Add (or, with sign=-1, remove) a card, changing these stats in place."
+        self.size += sign
+        self.vp += sign * card.vp
+        self.treasure += sign * card.treasure
+        self.coins += sign * card.coins
+        self.cost += sign * card.cost
+        if card.index >= len(self.counts):
+            self.counts.extend([0] * (card.index + 1 - len(self.counts)))
+        self.counts[card.index] += sign
+        assert self.counts[card.index] >= 0
+
+    def plus(self, *cards):
+        """
+        Get new stats with some cards added. This copies the count vector,
+        which has an entry for every registered card.
+        """
+        stats = self.copy()
+        for card in cards:
+            stats.add(card)
+        return stats
+
+    def minus(self, card):
+        "Get new stats with a card removed, copying the count vector."
+        stats = self.copy()
+        stats.add(card, -1)
+        return stats
+
+    def count(self, card):
+        if card.index >= len(self.counts): return 0
+        return self.counts[card.index]
+
 class PlayerState(object):
     """
     A PlayerState represents all the game state that is particular to a player,
     including the number of actions, buys, and +coins they have.
     """
     def __init__(self, player, hand, drawpile, discard, tableau, actions=0,
-                 buys=0, coins=0):
+                 buys=0, coins=0, rng=random, stats=None):
         self.player = player
         self.actions = actions;   assert isinstance(self.actions, int)
         self.buys = buys;         assert isinstance(self.buys, int)
@@ -106,13 +313,20 @@ class PlayerState(object):
         self.drawpile = drawpile; assert isinstance(self.drawpile, tuple)
         self.discard = discard;   assert isinstance(self.discard, tuple)
         self.tableau = tableau;   assert isinstance(self.tableau, tuple)
+        # the random number generator that shuffles this player's deck
+        self.rng = rng
+        # running totals over the whole deck, shared by every state that
+        # has the same cards
+        if stats is None:
+            stats = DeckStats.of(self.all_cards())
+        self.stats = stats
         # TODO: duration cards
     
     @staticmethod
-    def initial_state(player):
+    def initial_state(player, rng=random):
         # put it all in the discard pile so it auto-shuffles, then draw
         return PlayerState(player, hand=(), drawpile=(),
-        discard=(copper,)*7 + (estate,)*3, tableau=()).next_turn()
+        discard=(copper,)*7 + (estate,)*3, tableau=(), rng=rng).next_turn()
     
     def change(self, delta_actions=0, delta_buys=0, delta_cards=0, delta_coins=0):
         """
@@ -121,19 +335,39 @@ class PlayerState(object):
         """
         state= PlayerState(self.player, self.hand, self.drawpile, self.discard,
                            self.tableau, self.actions+delta_actions,
-                           self.buys+delta_buys, self.coins+delta_coins)
+                           self.buys+delta_buys, self.coins+delta_coins,
+                           self.rng, self.stats)
         assert delta_cards >= 0
         if delta_cards > 0:
             return state.draw(delta_cards)
         else: return state
     
     def deck_size(self):
-        return len(self.all_cards())
+        return self.stats.size
     __len__ = deck_size
 
+    def drawpile_size(self):
+        "How many cards are left in the drawpile?"
+        return len(self.drawpile)
+
     def all_cards(self):
         return self.hand + self.tableau + self.drawpile + self.discard
 
+    def deck_count(self, card):
+        """How many copies of a given card does this player have?"""
+        return self.stats.count(card)
+
+    def deck_counts(self):
+        "A count vector of all the cards this player has."
+        return tuple(self.stats.counts)
+
+    def total_money(self):
+        """
+        How much money is in the deck, counting both treasure and +coins
+        from actions?
+        """
+        return self.stats.treasure + self.stats.coins
+
     def hand_value(self):
         """How many coins can the player spend?"""
         return self.coins + sum(card.treasure for card in self.hand)
@@ -141,8 +375,24 @@ class PlayerState(object):
     def hand_size(self):
         return len(self.hand)
 
+    def canonical_key(self, drawpile_order=False):
+        """
+        A hashable key that is the same for every state with the same cards
+        in the same places and the same actions, buys and coins. The order
+        of the hand, discard pile and tableau doesn't matter. Neither does
+        the order of the drawpile, unless `drawpile_order` is True: it can
+        matter to how a turn goes, but the player can't see it.
+        """
+        if drawpile_order:
+            drawpile = tuple([card.index for card in self.drawpile])
+        else:
+            drawpile = zone_key(self.drawpile)
+        return (self.player, zone_key(self.hand), drawpile,
+                zone_key(self.discard), zone_key(self.tableau),
+                self.actions, self.buys, self.coins)
+
     def is_defended(self):
-        return any(x.isDefense() for x in self.hand)
+        return any(x.is_defense for x in self.hand)
     
     def get_reactions(self):
         """
@@ -158,22 +408,23 @@ class PlayerState(object):
         if len(self.drawpile) >= n:
             return PlayerState(
               self.player, self.hand+self.drawpile[:n], self.drawpile[n:],
-              self.discard, self.tableau, self.actions, self.buys, self.coins
+              self.discard, self.tableau, self.actions, self.buys, self.coins,
+              self.rng, self.stats
             )
         elif self.discard:
             got = self.drawpile
             newdraw = list(self.discard)
-            random.shuffle(newdraw)
+            self.rng.shuffle(newdraw)
 
             state2 = PlayerState(
               self.player, self.hand+got, tuple(newdraw), (), self.tableau,
-              self.actions, self.buys, self.coins
+              self.actions, self.buys, self.coins, self.rng, self.stats
             )
             return state2.draw(n-len(got))
         else:
             return PlayerState(
               self.player, self.hand+self.drawpile, (), (), self.tableau,
-              self.actions, self.buys, self.coins
+              self.actions, self.buys, self.coins, self.rng, self.stats
             )
 
     def next_turn(self):
@@ -182,21 +433,23 @@ class PlayerState(object):
         """
         return PlayerState(
           self.player, (), self.drawpile, self.discard+self.hand+self.tableau,
-          (), actions=1, buys=1, coins=0
+          (), actions=1, buys=1, coins=0, rng=self.rng, stats=self.stats
         ).draw(5)
 
     def gain(self, card):
         "Gain a single card."
         return PlayerState(
           self.player, self.hand, self.drawpile, self.discard+(card,),
-          self.tableau, self.actions, self.buys, self.coins
+          self.tableau, self.actions, self.buys, self.coins, self.rng,
+          self.stats.plus(card)
         )
     
     def gain_cards(self, cards):
         "Gain multiple cards."
         return PlayerState(
           self.player, self.hand, self.drawpile, self.discard+cards,
-          self.tableau, self.actions, self.buys, self.coins
+          self.tableau, self.actions, self.buys, self.coins, self.rng,
+          self.stats.plus(*cards)
         )
 
     def play_card(self, card):
@@ -211,9 +464,9 @@ class PlayerState(object):
         newhand = self.hand[:index] + self.hand[index+1:]
         result = PlayerState(
           self.player, newhand, self.drawpile, self.discard,
-          self.tableau+(card,), self.actions, self.buys, self.coins
+          self.tableau+(card,), self.actions, self.buys, self.coins,
+          self.rng, self.stats
         )
-        assert len(self) == len(result)
         return result
     
     def play_action(self, card):
@@ -234,7 +487,8 @@ class PlayerState(object):
         newhand = self.hand[:index] + self.hand[index+1:]
         return PlayerState(
           self.player, newhand, self.drawpile, self.discard+(card,),
-          self.tableau, self.actions, self.buys, self.coins
+          self.tableau, self.actions, self.buys, self.coins, self.rng,
+          self.stats
         )
 
     def trash_card(self, card):
@@ -245,13 +499,14 @@ class PlayerState(object):
         newhand = self.hand[:index] + self.hand[index+1:]
         return PlayerState(
           self.player, newhand, self.drawpile, self.discard,
-          self.tableau, self.actions, self.buys, self.coins
+          self.tableau, self.actions, self.buys, self.coins, self.rng,
+          self.stats.minus(card)
         )
 
     def actionable(self):
         """Are there actions left to take with this hand?"""
         return (self.actions > 0 
-                and any(c.isAction() for c in self.hand))
+                and any(c.is_action for c in self.hand))
 
     def buyable(self):
         """Can this hand still buy a card?"""
@@ -271,17 +526,26 @@ class PlayerState(object):
 
     def score(self):
         """How many points is this deck worth?"""
-        return sum(card.vp for card in self.all_cards())
+        return self.stats.vp
 
     def simulate(self):
         return self.simulation_state()
 
+    def freeze(self):
+        "Get an immutable version of this state. This one already is."
+        return self
+
     def simulate_from_here(self):
+        """
+        Get a copy of this state in which the drawpile, which the player
+        can't see, has been reshuffled.
+        """
+        rng = simulation_rng(self.rng)
         newdraw = list(self.drawpile)
-        random.shuffle(newdraw)
+        rng.shuffle(newdraw)
         return PlayerState(self.player, self.hand, tuple(newdraw),
                            self.discard, self.tableau, self.actions,
-                           self.buys, self.coins)
+                           self.buys, self.coins, rng, self.stats)
 
     def simulation_state(self, cards=()):
         """
@@ -290,7 +554,8 @@ class PlayerState(object):
         gaining a new card.
         """
         state = PlayerState(self.player, (), cards, self.all_cards(), (),
-                            1, 1, 0)
+                            1, 1, 0, simulation_rng(self.rng),
+                            self.stats.plus(*cards))
         return state.draw(5)
 
     def simulate_hands(self, n=100, cards=()):
@@ -299,16 +564,780 @@ class PlayerState(object):
         coins and buys they end with.
         """
         for i in xrange(n):
-            # make sure there are cards to gain, even though we haven't
-            # kept track of the real game state
             game = Game([self.simulation_state(cards)],
-                        {province: 12, duchy: 12, estate: 12,
-                         copper: 12, silver: 12, gold: 12},
-                        simulated=True
-            )
+                        simulation_supply(), simulated=True)
             coins, buys = game.simulate_turn()
             yield coins, buys
 
+class MutablePlayerState(PlayerState):
+    """
+    A PlayerState that changes in place, used by games set up with
+    `in_place=True`. Every method that would return a new state instead
+    modifies this one and returns it, and the zones are lists instead of
+    tuples.
+
+    Because the state keeps changing, code that wants to remember a
+    position must call freeze() to get an immutable copy, or Game.fork()
+    to get one that's safe to look ahead in.
+    """
+    def __init__(self, player, hand, drawpile, discard, tableau, actions=0,
+                 buys=0, coins=0, rng=random, stats=None):
+        self.player = player
+        self.actions = actions
+        self.buys = buys
+        self.coins = coins
+        self.hand = list(hand)
+        self.drawpile = list(drawpile)
+        self.discard = list(discard)
+        self.tableau = list(tableau)
+        self.rng = rng
+        if stats is None:
+            stats = DeckStats.of(self.all_cards())
+        else:
+            stats = stats.copy()
+        self.stats = stats
+
+    @staticmethod
+    def initial_state(player, rng=random):
+        return MutablePlayerState(player, hand=(), drawpile=(),
+          discard=(copper,)*7 + (estate,)*3, tableau=(), rng=rng).next_turn()
+
+    def freeze(self):
+        return PlayerState(self.player, tuple(self.hand),
+                           tuple(self.drawpile), tuple(self.discard),
+                           tuple(self.tableau), self.actions, self.buys,
+                           self.coins, self.rng, self.stats.copy())
+
+    def change(self, delta_actions=0, delta_buys=0, delta_cards=0, delta_coins=0):
+        self.actions += delta_actions
+        self.buys += delta_buys
+        self.coins += delta_coins
+        assert delta_cards >= 0
+        if delta_cards > 0:
+            self.draw(delta_cards)
+        return self
+
+    def all_cards(self):
+        return tuple(self.hand + self.tableau + self.drawpile + self.discard)
+
+    def draw(self, n=1):
+        while n > 0:
+            if not self.drawpile:
+                if not self.discard: break
+                self.drawpile = self.discard
+                self.discard = []
+                self.rng.shuffle(self.drawpile)
+            got = self.drawpile[:n]
+            del self.drawpile[:n]
+            self.hand.extend(got)
+            n -= len(got)
+        return self
+
+    def next_turn(self):
+        self.discard.extend(self.hand)
+        self.discard.extend(self.tableau)
+        del self.hand[:]
+        del self.tableau[:]
+        self.actions = 1
+        self.buys = 1
+        self.coins = 0
+        return self.draw(5)
+
+    def gain(self, card):
+        self.discard.append(card)
+        self.stats.add(card)
+        return self
+
+    def gain_cards(self, cards):
+        self.discard.extend(cards)
+        for card in cards:
+            self.stats.add(card)
+        return self
+
+    def play_card(self, card):
+        self.hand.remove(card)
+        self.tableau.append(card)
+        return self
+
+    def discard_card(self, card):
+        self.hand.remove(card)
+        self.discard.append(card)
+        return self
+
+    def trash_card(self, card):
+        self.hand.remove(card)
+        self.stats.add(card, -1)
+        return self
+
+    def simulate_from_here(self):
+        return self.freeze().simulate_from_here()
+
+def simulation_card_counts():
+    """
+    Make sure there are cards to gain in a simulation, even though it doesn't
+    keep track of the real game state.
+    """
+    return {province: 12, duchy: 12, estate: 12,
+            copper: 12, silver: 12, gold: 12}
+
+def simulation_supply():
+    "Like simulation_card_counts, but as a Supply."
+    return SIMULATION_SUPPLY.copy()
+
+def count_vector(cards=()):
+    """
+    Make a vector of counts, indexed by Card.index, out of a sequence of cards.
+    """
+    counts = [0] * len(ALL_CARDS)
+    for card in cards:
+        counts[card.index] += 1
+    return tuple(counts)
+
+def add_counts(counts, cards, sign=1):
+    """
+    Add (or, with sign=-1, remove) a sequence of cards to a count vector.
+    """
+    counts = list(counts)
+    for card in cards:
+        if card.index >= len(counts):
+            counts.extend([0] * (card.index + 1 - len(counts)))
+        counts[card.index] += sign
+        assert counts[card.index] >= 0
+    return tuple(counts)
+
+def sum_counts(*vectors):
+    "Add count vectors elementwise."
+    return tuple(sum(column) for column in izip_longest(*vectors, fillvalue=0))
+
+def zone_key(cards):
+    "An order-insensitive key for a zone: the sorted indices of its cards."
+    return tuple(sorted([card.index for card in cards]))
+
+def counts_key(counts):
+    "The zone_key of the cards in a count vector."
+    key = ()
+    for index, count in enumerate(counts):
+        if count:
+            key += (index,) * count
+    return key
+
+def expand_counts(counts):
+    """
+    Turn a count vector back into a tuple of cards, in order of Card.index.
+    """
+    cards = []
+    for index, count in enumerate(counts):
+        if count:
+            cards.extend([ALL_CARDS[index]] * count)
+    return tuple(cards)
+
+def counts_stats(counts):
+    "The DeckStats of the cards in a count vector."
+    stats = DeckStats()
+    for index, count in enumerate(counts):
+        for i in xrange(count):
+            stats.add(ALL_CARDS[index])
+    return stats
+
+class MultisetPlayerState(PlayerState):
+    """
+    A PlayerState that represents the hand, discard pile and tableau as
+    vectors of card counts, indexed by Card.index, instead of tuples of
+    cards. Only the drawpile keeps its order, because that's the only place
+    where the order matters.
+
+    Zones that are count vectors can be moved around without looking at
+    each card, and removing a card from the hand doesn't involve searching
+    for it. The engine only uses the counts (`hand_counts`,
+    `discard_counts`, `tableau_counts` and `draw_counts`), except to
+    shuffle the discard pile into a new drawpile.
+
+    The `hand`, `discard` and `tableau` attributes are still available as
+    tuples, in order of Card.index, for code that wants to look at the
+    cards, such as a Decision's choices; each access builds a new tuple.
+    """
+    def __init__(self, player, hand, drawpile, discard, tableau, actions=0,
+                 buys=0, coins=0, rng=random, draw_counts=None, stats=None):
+        self.player = player
+        self.actions = actions;   assert isinstance(self.actions, int)
+        self.buys = buys;         assert isinstance(self.buys, int)
+        self.coins = coins;       assert isinstance(self.coins, int)
+        self.hand_counts = hand
+        self.drawpile = drawpile; assert isinstance(self.drawpile, tuple)
+        self.discard_counts = discard
+        self.tableau_counts = tableau
+        if draw_counts is None:
+            draw_counts = count_vector(drawpile)
+        self.draw_counts = draw_counts
+        self.rng = rng
+        if stats is None:
+            stats = counts_stats(sum_counts(hand, draw_counts, discard,
+                                            tableau))
+        self.stats = stats
+
+    @staticmethod
+    def initial_state(player, rng=random):
+        return MultisetPlayerState(player, count_vector(), (),
+          count_vector((copper,)*7 + (estate,)*3), count_vector(),
+          rng=rng).next_turn()
+
+    @property
+    def hand(self):
+        return expand_counts(self.hand_counts)
+
+    @property
+    def discard(self):
+        return expand_counts(self.discard_counts)
+
+    @property
+    def tableau(self):
+        return expand_counts(self.tableau_counts)
+
+    def _replace(self, hand=None, drawpile=None, discard=None, tableau=None,
+                 actions=None, buys=None, coins=None, rng=None,
+                 draw_counts=None, stats=None):
+        """
+        Make a copy of this state with some of its parts replaced.
+        """
+        if drawpile is None:
+            drawpile = self.drawpile
+            draw_counts = self.draw_counts
+        return MultisetPlayerState(
+          self.player,
+          self.hand_counts if hand is None else hand,
+          drawpile,
+          self.discard_counts if discard is None else discard,
+          self.tableau_counts if tableau is None else tableau,
+          self.actions if actions is None else actions,
+          self.buys if buys is None else buys,
+          self.coins if coins is None else coins,
+          self.rng if rng is None else rng,
+          draw_counts,
+          self.stats if stats is None else stats
+        )
+
+    def change(self, delta_actions=0, delta_buys=0, delta_cards=0, delta_coins=0):
+        state = self._replace(actions=self.actions+delta_actions,
+                              buys=self.buys+delta_buys,
+                              coins=self.coins+delta_coins)
+        assert delta_cards >= 0
+        if delta_cards > 0:
+            return state.draw(delta_cards)
+        else: return state
+
+    def all_cards(self):
+        return self.hand + self.tableau + self.drawpile + self.discard
+
+    def hand_value(self):
+        value = self.coins
+        for index, count in enumerate(self.hand_counts):
+            if count:
+                value += ALL_CARDS[index].treasure * count
+        return value
+
+    def hand_size(self):
+        return sum(self.hand_counts)
+
+    def is_defended(self):
+        for index, count in enumerate(self.hand_counts):
+            if count and ALL_CARDS[index].is_defense:
+                return True
+        return False
+
+    def canonical_key(self, drawpile_order=False):
+        if drawpile_order:
+            drawpile = tuple([card.index for card in self.drawpile])
+        else:
+            drawpile = counts_key(self.draw_counts)
+        return (self.player, counts_key(self.hand_counts), drawpile,
+                counts_key(self.discard_counts),
+                counts_key(self.tableau_counts),
+                self.actions, self.buys, self.coins)
+
+    def draw(self, n=1):
+        if len(self.drawpile) >= n:
+            drawn = self.drawpile[:n]
+            return self._replace(
+              hand=add_counts(self.hand_counts, drawn),
+              drawpile=self.drawpile[n:],
+              draw_counts=add_counts(self.draw_counts, drawn, -1)
+            )
+        elif any(self.discard_counts):
+            newdraw = list(expand_counts(self.discard_counts))
+            self.rng.shuffle(newdraw)
+            got = len(self.drawpile)
+            state2 = self._replace(
+              hand=sum_counts(self.hand_counts, self.draw_counts),
+              drawpile=tuple(newdraw),
+              draw_counts=self.discard_counts,
+              discard=count_vector()
+            )
+            return state2.draw(n-got)
+        else:
+            return self._replace(
+              hand=sum_counts(self.hand_counts, self.draw_counts),
+              drawpile=(), draw_counts=count_vector()
+            )
+
+    def next_turn(self):
+        return self._replace(
+          hand=count_vector(), tableau=count_vector(),
+          discard=sum_counts(self.discard_counts, self.hand_counts,
+                             self.tableau_counts),
+          actions=1, buys=1, coins=0
+        ).draw(5)
+
+    def gain(self, card):
+        return self._replace(discard=add_counts(self.discard_counts, (card,)),
+                             stats=self.stats.plus(card))
+
+    def gain_cards(self, cards):
+        return self._replace(discard=add_counts(self.discard_counts, cards),
+                             stats=self.stats.plus(*cards))
+
+    def play_card(self, card):
+        return self._replace(hand=add_counts(self.hand_counts, (card,), -1),
+                             tableau=add_counts(self.tableau_counts, (card,)))
+
+    def discard_card(self, card):
+        return self._replace(hand=add_counts(self.hand_counts, (card,), -1),
+                             discard=add_counts(self.discard_counts, (card,)))
+
+    def trash_card(self, card):
+        return self._replace(hand=add_counts(self.hand_counts, (card,), -1),
+                             stats=self.stats.minus(card))
+
+    def actionable(self):
+        if self.actions <= 0: return False
+        for index, count in enumerate(self.hand_counts):
+            if count and ALL_CARDS[index].is_action:
+                return True
+        return False
+
+    def simulate_from_here(self):
+        rng = simulation_rng(self.rng)
+        newdraw = list(self.drawpile)
+        rng.shuffle(newdraw)
+        return self._replace(drawpile=tuple(newdraw), rng=rng,
+                             draw_counts=self.draw_counts)
+
+    def simulation_state(self, cards=()):
+        state = MultisetPlayerState(self.player, count_vector(), tuple(cards),
+                                    self.deck_counts(), count_vector(),
+                                    1, 1, 0, simulation_rng(self.rng),
+                                    stats=self.stats.plus(*cards))
+        return state.draw(5)
+
+def push_cards(cards, rest=None):
+    """
+    Put cards on top of a persistent pile: a linked list of (card, rest)
+    pairs, newest first, that ends in None. The pile it's put on isn't
+    changed, so any number of piles can share what's under them.
+    """
+    for card in cards:
+        rest = (card, rest)
+    return rest
+
+def pile_cards(pile):
+    "The cards in a persistent pile, oldest first, as a tuple."
+    cards = []
+    while pile is not None:
+        card, pile = pile
+        cards.append(card)
+    cards.reverse()
+    return tuple(cards)
+
+class SharedPlayerState(PlayerState):
+    """
+    An immutable PlayerState whose zones share structure with the states
+    they came from, used by games set up with `shared=True`.
+
+    The drawpile is a tuple of the cards as they were shuffled, `pile`, and
+    the number of them that have been drawn, `top`; drawing moves `top`
+    instead of copying what's left. The discard pile is a persistent pile
+    (see push_cards), so gaining and discarding a card, or discarding the
+    hand at the end of a turn, only adds pairs on top of it. Either way,
+    drawing or discarding costs as much as the cards that move, not the
+    size of the deck.
+
+    The `drawpile` and `discard` attributes are still available as tuples,
+    in the same order as PlayerState's, so the same seed shuffles the same
+    way.
+    """
+    def __init__(self, player, hand, pile, top, discard, discard_size,
+                 tableau, actions=0, buys=0, coins=0, rng=random, stats=None):
+        self.player = player
+        self.actions = actions
+        self.buys = buys
+        self.coins = coins
+        self.hand = hand
+        self.pile = pile
+        self.top = top
+        self.discard_pile = discard
+        self.discard_size = discard_size
+        self.tableau = tableau
+        self.rng = rng
+        if stats is None:
+            stats = DeckStats.of(self.all_cards())
+        self.stats = stats
+
+    @staticmethod
+    def initial_state(player, rng=random):
+        start = (copper,)*7 + (estate,)*3
+        return SharedPlayerState(player, (), (), 0, push_cards(start),
+                                 len(start), (), rng=rng).next_turn()
+
+    @property
+    def drawpile(self):
+        return self.pile[self.top:]
+
+    @property
+    def discard(self):
+        return pile_cards(self.discard_pile)
+
+    def drawpile_size(self):
+        return len(self.pile) - self.top
+
+    def _replace(self, hand=None, tableau=None, discard=None,
+                 discard_size=None, actions=None, buys=None, coins=None,
+                 stats=None):
+        "Make a copy of this state with some of its parts replaced."
+        if discard is None:
+            discard = self.discard_pile
+            discard_size = self.discard_size
+        return self.__class__(
+          self.player,
+          self.hand if hand is None else hand,
+          self.pile, self.top, discard, discard_size,
+          self.tableau if tableau is None else tableau,
+          self.actions if actions is None else actions,
+          self.buys if buys is None else buys,
+          self.coins if coins is None else coins,
+          self.rng,
+          self.stats if stats is None else stats
+        )
+
+    def change(self, delta_actions=0, delta_buys=0, delta_cards=0, delta_coins=0):
+        state = self._replace(actions=self.actions+delta_actions,
+                              buys=self.buys+delta_buys,
+                              coins=self.coins+delta_coins)
+        assert delta_cards >= 0
+        if delta_cards > 0:
+            return state.draw(delta_cards)
+        else: return state
+
+    def draw(self, n=1):
+        pile, top, hand = self.pile, self.top, self.hand
+        discard, discard_size = self.discard_pile, self.discard_size
+        while n > 0:
+            if top + n <= len(pile):
+                hand += pile[top:top+n]
+                top += n
+                break
+            hand += pile[top:]
+            n -= len(pile) - top
+            if not discard_size:
+                top = len(pile)
+                break
+            newdraw = list(pile_cards(discard))
+            self.rng.shuffle(newdraw)
+            pile, top = tuple(newdraw), 0
+            discard, discard_size = None, 0
+        return SharedPlayerState(
+          self.player, hand, pile, top, discard, discard_size, self.tableau,
+          self.actions, self.buys, self.coins, self.rng, self.stats
+        )
+
+    def next_turn(self):
+        discard = push_cards(self.tableau, push_cards(self.hand,
+                                                      self.discard_pile))
+        return self.__class__(
+          self.player, (), self.pile, self.top, discard,
+          self.discard_size + len(self.hand) + len(self.tableau), (),
+          1, 1, 0, self.rng, self.stats
+        ).draw(5)
+
+    def gain(self, card):
+        return self._replace(discard=(card, self.discard_pile),
+                             discard_size=self.discard_size + 1,
+                             stats=self.stats.plus(card))
+
+    def gain_cards(self, cards):
+        return self._replace(discard=push_cards(cards, self.discard_pile),
+                             discard_size=self.discard_size + len(cards),
+                             stats=self.stats.plus(*cards))
+
+    def play_card(self, card):
+        index = self.hand.index(card)
+        return self._replace(hand=self.hand[:index] + self.hand[index+1:],
+                             tableau=self.tableau + (card,))
+
+    def discard_card(self, card):
+        index = self.hand.index(card)
+        return self._replace(hand=self.hand[:index] + self.hand[index+1:],
+                             discard=(card, self.discard_pile),
+                             discard_size=self.discard_size + 1)
+
+    def trash_card(self, card):
+        index = self.hand.index(card)
+        return self._replace(hand=self.hand[:index] + self.hand[index+1:],
+                             stats=self.stats.minus(card))
+
+    def simulate_from_here(self):
+        rng = simulation_rng(self.rng)
+        newdraw = list(self.drawpile)
+        rng.shuffle(newdraw)
+        return SharedPlayerState(
+          self.player, self.hand, tuple(newdraw), 0, self.discard_pile,
+          self.discard_size, self.tableau, self.actions, self.buys,
+          self.coins, rng, self.stats
+        )
+
+    def simulation_state(self, cards=()):
+        cards = tuple(cards)
+        everything = self.all_cards()
+        state = SharedPlayerState(self.player, (), cards, 0,
+                                  push_cards(everything), len(everything), (),
+                                  1, 1, 0, simulation_rng(self.rng),
+                                  self.stats.plus(*cards))
+        return state.draw(5)
+
+class LazyPile(object):
+    """
+    A shuffled pile of cards whose order is only decided when it's needed.
+
+    The first `fixed` of `cards` are in their shuffled order, and the rest
+    are in no particular order. When more cards are needed, each one is
+    picked at random from the rest: a Fisher-Yates shuffle, a step at a
+    time. That gives every order the same chance, just as shuffling the
+    whole pile would, but only spends random numbers on the cards that get
+    drawn.
+
+    The order is decided once, in the pile, so every state that draws from
+    it sees the same cards.
+    """
+    def __init__(self, cards, rng, fixed=0):
+        self.cards = list(cards)
+        self.rng = rng
+        self.fixed = fixed
+
+    def __len__(self):
+        return len(self.cards)
+
+    def fix(self, n):
+        "Decide the order of the first n cards."
+        cards = self.cards
+        size = len(cards)
+        random = self.rng.random
+        # once all but one are in place, so is the last
+        for i in xrange(self.fixed, min(n, size - 1)):
+            j = i + int(random() * (size - i))
+            cards[i], cards[j] = cards[j], cards[i]
+        if n > self.fixed:
+            self.fixed = min(n, size)
+
+    def take(self, start, stop):
+        "The cards from `start` to `stop`, in order."
+        if stop > self.fixed:
+            self.fix(stop)
+        return tuple(self.cards[start:stop])
+
+class LazyPlayerState(SharedPlayerState):
+    """
+    A SharedPlayerState whose shuffles are lazy, used by games set up with
+    `lazy=True`. Its `pile` is a LazyPile, so reshuffling the discard pile,
+    or the whole deck for a simulated hand, costs only as many random
+    numbers as there are cards drawn before the next shuffle.
+
+    Hands come out with the same distribution as with PlayerState, but not
+    the same hands for the same seed, since the random numbers are used in
+    a different order. Looking at `drawpile` decides the order of all of
+    it; all_cards() and canonical_key() don't need to.
+    """
+    @staticmethod
+    def initial_state(player, rng=random):
+        start = (copper,)*7 + (estate,)*3
+        return LazyPlayerState(player, (), LazyPile(start, rng), 0, None, 0,
+                               (), 1, 1, 0, rng).draw(5)
+
+    @property
+    def drawpile(self):
+        return self.pile.take(self.top, len(self.pile))
+
+    def undrawn(self):
+        "The cards in the drawpile, in no particular order."
+        return tuple(self.pile.cards[self.top:])
+
+    def all_cards(self):
+        return self.hand + self.tableau + self.undrawn() + self.discard
+
+    def canonical_key(self, drawpile_order=False):
+        if drawpile_order:
+            drawpile = tuple([card.index for card in self.drawpile])
+        else:
+            drawpile = zone_key(self.undrawn())
+        return (self.player, zone_key(self.hand), drawpile,
+                zone_key(self.discard), zone_key(self.tableau),
+                self.actions, self.buys, self.coins)
+
+    def draw(self, n=1):
+        pile, top, hand = self.pile, self.top, self.hand
+        discard, discard_size = self.discard_pile, self.discard_size
+        while n > 0:
+            if top + n <= len(pile):
+                hand += pile.take(top, top + n)
+                top += n
+                break
+            hand += pile.take(top, len(pile))
+            n -= len(pile) - top
+            if not discard_size:
+                top = len(pile)
+                break
+            pile, top = LazyPile(pile_cards(discard), self.rng), 0
+            discard, discard_size = None, 0
+        return LazyPlayerState(
+          self.player, hand, pile, top, discard, discard_size, self.tableau,
+          self.actions, self.buys, self.coins, self.rng, self.stats
+        )
+
+    def simulate_from_here(self):
+        rng = simulation_rng(self.rng)
+        return LazyPlayerState(
+          self.player, self.hand, LazyPile(self.undrawn(), rng), 0,
+          self.discard_pile, self.discard_size, self.tableau, self.actions,
+          self.buys, self.coins, rng, self.stats
+        )
+
+    def simulation_state(self, cards=()):
+        # Drawing `cards` and then shuffling in the rest of the deck is the
+        # same as drawing from one pile with `cards` fixed on top.
+        cards = tuple(cards)
+        rng = simulation_rng(self.rng)
+        pile = LazyPile(cards + self.all_cards(), rng, len(cards))
+        state = LazyPlayerState(self.player, (), pile, 0, None, 0, (),
+                                1, 1, 0, rng, self.stats.plus(*cards))
+        return state.draw(5)
+
+class Supply(object):
+    """
+    The piles of cards on the table that can be bought or gained.
+
+    The piles are kept in order of cost (the same order that cards sort in),
+    along with a precomputed index of how many of them cost at most N coins,
+    and a running count of the empty piles. This makes listing the cards
+    someone can buy, and checking for the end of the game, take about
+    constant time.
+
+    A Supply can be read like the dictionary of pile sizes it was made
+    from. Games that aren't in-place treat it as immutable, using remove()
+    to get a new Supply with one card gone; in-place games use take().
+    Copies share their pile sizes until one of them changes, so copying a
+    Supply for a simulated game is cheap.
+    """
+    __slots__ = ('cards', 'position', 'limits', 'counts', 'empty',
+                 '_owned', '_affordable', '_indices')
+
+    def __init__(self, card_counts):
+        self.cards = tuple(sorted(card_counts))
+        self.position = dict((card, pos) for pos, card in enumerate(self.cards))
+        # limits[n] is the number of piles that cost at most n coins
+        max_cost = max([card.cost for card in self.cards] + [0])
+        self.limits = tuple(len([card for card in self.cards if card.cost <= n])
+                            for n in xrange(max_cost + 1))
+        self.counts = [card_counts[card] for card in self.cards]
+        self.empty = self.counts.count(0)
+        self._owned = True
+        self._affordable = {}
+        self._indices = tuple([card.index for card in self.cards])
+
+    def copy(self):
+        supply = Supply.__new__(Supply)
+        supply.cards = self.cards
+        supply.position = self.position
+        supply.limits = self.limits
+        supply.counts = self.counts
+        supply.empty = self.empty
+        supply._affordable = self._affordable
+        supply._indices = self._indices
+        supply._owned = self._owned = False
+        return supply
+
+    def take(self, card):
+        "Remove a card from its pile, changing this Supply in place."
+        if not self._owned:
+            self.counts = list(self.counts)
+            self._owned = True
+        pos = self.position[card]
+        self.counts[pos] -= 1
+        assert self.counts[pos] >= 0
+        if self.counts[pos] == 0:
+            self.empty += 1
+            self._affordable = {}
+        return self
+
+    def remove(self, card):
+        "Get a new Supply with a card removed from its pile."
+        return self.copy().take(card)
+
+    def affordable(self, coins):
+        """
+        Get a tuple of the cards, in order of cost, that are left in the
+        supply and cost at most `coins`. It's shared with every other call,
+        which is why it's a tuple.
+        """
+        if coins >= len(self.limits): coins = len(self.limits) - 1
+        try:
+            return self._affordable[coins]
+        except KeyError:
+            counts = self.counts
+            cards = tuple([card for pos, card in
+                           enumerate(self.cards[:self.limits[coins]])
+                           if counts[pos] > 0])
+            self._affordable[coins] = cards
+            return cards
+
+    def available(self):
+        "Get a tuple of all the cards left in the supply, in order of cost."
+        return self.affordable(len(self.limits) - 1)
+
+    def empty_piles(self):
+        return self.empty
+
+    def __getitem__(self, card):
+        return self.counts[self.position[card]]
+
+    def get(self, card, default=None):
+        if card not in self.position: return default
+        return self[card]
+
+    def __contains__(self, card):
+        return card in self.position
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def keys(self):
+        return list(self.cards)
+
+    def values(self):
+        return list(self.counts)
+
+    def items(self):
+        return zip(self.cards, self.counts)
+
+    def canonical_key(self):
+        "A hashable key for which piles there are and how big they are."
+        return (self._indices, tuple(self.counts))
+
+    def __repr__(self):
+        return '<Supply: %s>' % ', '.join('%s: %d' % item
+                                          for item in self.items())
+
+SIMULATION_SUPPLY = Supply(simulation_card_counts())
+
 # How many duchies/provinces are there for n players?
 VICTORY_CARDS = {
     1: 5,  # useful for simulation
@@ -319,31 +1348,137 @@ VICTORY_CARDS = {
     6: 18
 }
 
+def flatten_steps(steps):
+    """
+    Run a tree of step generators without recursion.
+
+    A step generator describes part of a game that may need decisions. It
+    yields a Decision when a player has to decide something, and is sent
+    back the Game that results. It can also yield another step generator,
+    which runs to completion first and sends back its result. Finally, it
+    yields the Game that it ends with.
+
+    This generator flattens all of that into a single stream of Decisions,
+    followed by the final Game. A Decision can be answered with either the
+    resulting Game or a choice, which is passed to its choose_steps().
+    """
+    stack = [steps]
+    value = None
+    while True:
+        item = stack[-1].send(value)
+        if isinstance(item, Decision):
+            reply = yield item
+            if not isinstance(reply, Game):
+                reply = item.choose_steps(reply)
+            if isinstance(reply, Game):
+                value = reply
+            else:
+                value = None
+                stack.append(reply)
+        elif isinstance(item, Game):
+            stack.pop().close()
+            if not stack:
+                yield item
+                return
+            value = item
+        else:
+            value = None
+            stack.append(item)
+
+def run_steps(steps):
+    """
+    Run steps synchronously, with each decision made by the player it
+    belongs to, and return the resulting Game.
+    """
+    steps = flatten_steps(steps)
+    item = steps.next()
+    while isinstance(item, Decision):
+        item = steps.send(item.player().make_decision(item))
+    steps.close()
+    return item
+
 class Game(object):
-    def __init__(self, playerstates, card_counts, turn=0, simulated=False):
+    """
+    The state of a whole game: every player's state, the cards left in the
+    supply, and whose turn it is.
+
+    Normally a Game is immutable, and every method that changes something
+    returns a new Game. A game that is set up with `in_place=True` instead
+    changes itself and returns itself, which allocates far less; use fork()
+    to get an immutable copy of such a game to look ahead from.
+
+    `listeners` is a tuple of GameListeners (see events.py) that are told
+    about everything that happens in the game.
+    """
+    def __init__(self, playerstates, supply, turn=0, simulated=False,
+                 in_place=False, listeners=()):
         self.playerstates = playerstates
-        self.card_counts = card_counts
-        self.turn = turn
-        self.player_turn = turn % len(playerstates)
-        self.round = turn // len(playerstates)
+        if not isinstance(supply, Supply):
+            supply = Supply(supply)
+        self.supply = supply
         self.simulated = simulated
-        logid = 'Game'
-        if self.simulated:
-            logid = 'Simulation'
-        self.log = logging.getLogger(logid)
-        if self.simulated:
-            self.log.setLevel(logging.WARN)
-        else:
-            self.log.setLevel(logging.INFO)
+        self.in_place = in_place
+        self.listeners = listeners
+        self.set_turn(turn)
+
+    def set_turn(self, turn):
+        self.turn = turn
+        self.player_turn = turn % len(self.playerstates)
+        self.round = turn // len(self.playerstates)
 
     def copy(self):
         "Make an exact copy of this game state."
-        return Game(self.playerstates[:], self.card_counts, self.turn,
-                    self.simulated)
+        supply = self.supply
+        if self.in_place: supply = supply.copy()
+        return Game(self.playerstates[:], supply, self.turn,
+                    self.simulated, listeners=self.listeners)
+
+    def successor(self):
+        """
+        Get a Game object to make changes to: a copy, or in an in-place game,
+        this game itself.
+        """
+        if self.in_place: return self
+        return self.copy()
+
+    def fork(self):
+        """
+        Take a snapshot of this game as an ordinary, immutable Game that's
+        safe to look ahead in: the simulated_copy of a frozen copy of it.
+        The hidden cards are reshuffled and the states get the simulation
+        random number generators, so playing on from a fork neither sees
+        the real draws nor changes the real shuffles. Bots that want to look
+        ahead from a decision in an in-place game should work from a fork.
+        """
+        return Game([state.freeze() for state in self.playerstates],
+                    self.supply.copy(), self.turn,
+                    self.simulated).simulated_copy()
 
     @staticmethod
-    def setup(players, var_cards=(), simulated=False):
-        "Set up the game."
+    def setup(players, var_cards=(), simulated=False, multiset=False,
+              shuffle=True, seed=None, in_place=False, listeners=None,
+              shared=False, lazy=False):
+        """
+        Set up the game. If `multiset` is True, the players' decks are
+        represented as vectors of card counts (see MultisetPlayerState). If
+        `in_place` is True, the game and its states change in place (see
+        MutablePlayerState). If `shared` is True, the states' zones share
+        structure, so that drawing doesn't copy the drawpile (see
+        SharedPlayerState). If `lazy` is True, they share structure too, and
+        shuffles only decide the order of the cards that get drawn (see
+        LazyPlayerState). At most one of these can be set.
+
+        The players are seated in a random order, unless `shuffle` is False,
+        in which case they play in the order given.
+
+        All the randomness in the game comes from `seed`. Each seat gets its
+        own GameRandom stream derived from it, so the same seed gives the
+        same shuffles to whoever sits in a given seat.
+
+        `listeners` is a sequence of GameListeners. By default, games that
+        aren't simulated are described in the log by a LoggingListener; pass
+        an empty list for a game that reports nothing.
+        """
         counts = {
             estate: VICTORY_CARDS[len(players)],
             duchy: VICTORY_CARDS[len(players)],
@@ -355,10 +1490,40 @@ class Game(object):
         for card in var_cards:
             counts[card] = 10
 
-        playerstates = [PlayerState.initial_state(p) for p in players]
-        random.shuffle(playerstates)
-        return Game(playerstates, counts, turn=0, simulated=simulated)
-
+        modes = [name for name, flag in (('in_place', in_place),
+                                         ('multiset', multiset),
+                                         ('shared', shared), ('lazy', lazy))
+                 if flag]
+        if len(modes) > 1:
+            raise ValueError("Only one of in_place, multiset, shared and lazy "
+                             "can be set, not %s" % ' and '.join(modes))
+        if in_place:
+            state_class = MutablePlayerState
+        elif multiset:
+            state_class = MultisetPlayerState
+        elif lazy:
+            state_class = LazyPlayerState
+        elif shared:
+            state_class = SharedPlayerState
+        else:
+            state_class = PlayerState
+        rng = random.Random(seed)
+        players = list(players)
+        if shuffle:
+            rng.shuffle(players)
+        playerstates = [state_class.initial_state(p, GameRandom(rng.getrandbits(64)))
+                        for p in players]
+        if listeners is None:
+            if simulated: listeners = ()
+            else: listeners = (LoggingListener(),)
+        return Game(playerstates, counts, turn=0, simulated=simulated,
+                    in_place=in_place, listeners=tuple(listeners))
+
+
+    @property
+    def rng(self):
+        "The random number generator for the current player's deck."
+        return self.state().rng
 
     def state(self):
         """
@@ -396,26 +1561,29 @@ class Game(object):
         """
         List all the cards that can currently be bought.
         """
-        choices = [card for card, count in self.card_counts.items()
-                   if count > 0]
-        choices.sort()
-        return choices
+        return list(self.supply.available())
+
+    @property
+    def card_counts(self):
+        "The supply, which can still be read like a dictionary of pile sizes."
+        return self.supply
 
     def remove_card(self, card):
         """
         Remove a single card from the table.
         """
-        new_counts = self.card_counts.copy()
-        new_counts[card] -= 1
-        assert new_counts[card] >= 0
-        return Game(self.playerstates[:], new_counts, self.player_turn, self.simulated)
+        if self.in_place:
+            self.supply.take(card)
+            return self
+        return Game(self.playerstates[:], self.supply.remove(card), self.turn,
+                    self.simulated, listeners=self.listeners)
 
     def replace_states(self, newstates):
         """
         Do something with the current player's state and make a new overall
         game state from it.
         """
-        newgame = self.copy()
+        newgame = self.successor()
         newgame.playerstates = newstates
         return newgame
     
@@ -424,7 +1592,7 @@ class Game(object):
         Do something with the current player's state and make a new overall
         game state from it.
         """
-        newgame = self.copy()
+        newgame = self.successor()
         newgame.playerstates[self.player_turn] = newstate
         return newgame
     
@@ -441,7 +1609,7 @@ class Game(object):
         Make a numerical change to the states of all non-current players, the
         same way as change_current_state.
         """
-        newgame = self.copy()
+        newgame = self.successor()
         for i in xrange(self.num_players()):
             if i == self.player_turn: continue
             newgame.playerstates[i] = newgame.playerstates[i].change(**changes)
@@ -455,7 +1623,7 @@ class Game(object):
         counter that requires them to make a decision. Implement attacks using
         the attack_with_decision method instead.
         """
-        newgame = self.copy()
+        newgame = self.successor()
         for i in xrange(self.num_players()):
             if i == self.player_turn: continue
             newgame.playerstates[i] = func(newgame.playerstates[i])
@@ -469,12 +1637,21 @@ class Game(object):
         This is useful when players need to make decisions in the middle of
         another player's turn, creating what we call here a "mini-turn".
         """
-        return Game(self.playerstates[:], self.card_counts, self.turn+1,
-                    self.simulated)
+        if self.in_place:
+            self.set_turn(self.turn+1)
+            return self
+        return Game(self.playerstates[:], self.supply, self.turn+1,
+                    self.simulated, listeners=self.listeners)
 
     def everyone_else_makes_a_decision(self, decision_template, attack=False):
+        return run_steps(self.everyone_else_decision_steps(decision_template,
+                                                           attack))
+
+    def everyone_else_decision_steps(self, decision_template, attack=False):
+        "The steps of everyone_else_makes_a_decision; see run_steps."
+        current = self.player_turn
         newgame = self.next_mini_turn()
-        while newgame.player_turn != self.player_turn:
+        while newgame.player_turn != current:
             if attack:
                 if newgame.state().is_defended():
                     newgame = newgame.next_mini_turn()
@@ -482,27 +1659,41 @@ class Game(object):
                 reactions = newgame.state().get_reactions()
                 for reaction in reactions:
                     newgame = reaction(newgame)
+                    if not isinstance(newgame, Game):
+                        newgame = yield newgame
             decision = decision_template(newgame)
             turn = newgame.player_turn
-            game2 = newgame.current_player().make_decision(decision)
+            game2 = yield decision
             assert game2.player_turn == turn
             newgame = game2.next_mini_turn()
-        return newgame
+        yield newgame
 
     def attack_with_decision(self, decision):
         return self.everyone_else_makes_a_decision(decision, attack=True)
 
+    def attack_steps(self, decision):
+        "The steps of attack_with_decision; see run_steps."
+        return self.everyone_else_decision_steps(decision, attack=True)
+
     def run_decisions(self):
         """
         Run through all the decisions the current player has to make, and
         return the resulting state.
         """
-        state = self.state()
-        decisiontype = state.next_decision()
-        if decisiontype is None: return self
-        decision = decisiontype(self)
-        newgame = self.current_player().make_decision(decision)
-        return newgame.run_decisions()
+        game = self
+        while True:
+            decisiontype = game.state().next_decision()
+            if decisiontype is None: return game
+            game = game.current_player().make_decision(decisiontype(game))
+
+    def decision_steps(self):
+        "The steps of run_decisions; see run_steps."
+        game = self
+        while True:
+            decisiontype = game.state().next_decision()
+            if decisiontype is None: break
+            game = yield decisiontype(game)
+        yield game
     
     def simulated_copy(self):
         """
@@ -512,10 +1703,10 @@ class Game(object):
         various actions.
         """
         return Game(
-            [state.simulated_from_here() if state is self.state()
+            [state.simulate_from_here() if state is self.state()
                                          else state.simulate()
              for state in self.playerstates],
-            self.card_counts,
+            self.supply.copy(),
             self.turn,
             simulated=True
         )
@@ -527,15 +1718,15 @@ class Game(object):
         the BigMoney strategy.
         """
         if not self.simulated: self = self.simulated_copy()
-        state = self.state()
-        decisiontype = state.next_decision()
-        if decisiontype is None:
-            assert False, "BuyDecision never happened this turn"
-        if decisiontype is BuyDecision:
-            return (state.hand_value(), state.buys)
-        decision = decisiontype(self)
-        newgame = self.current_player().make_decision(decision)
-        return newgame.simulate_turn()
+        game = self
+        while True:
+            state = game.state()
+            decisiontype = state.next_decision()
+            if decisiontype is None:
+                assert False, "BuyDecision never happened this turn"
+            if decisiontype is BuyDecision:
+                return (state.hand_value(), state.buys)
+            game = game.current_player().make_decision(decisiontype(game))
 
     def simulate_partial_turn(self):
         """
@@ -543,76 +1734,135 @@ class Game(object):
         return the state where the player buys stuff.
         """
         if not self.simulated: self = self.simulated_copy()
-        state = self.state()
-        decisiontype = state.next_decision()
-        if decisiontype is None:
-            assert False, "BuyDecision never happened this turn"
-        if decisiontype is BuyDecision:
-            return state
-        decision = decisiontype(self)
-        newgame = self.current_player().make_decision(decision)
-        return newgame.simulate_partial_turn()
+        game = self
+        while True:
+            state = game.state()
+            decisiontype = state.next_decision()
+            if decisiontype is None:
+                assert False, "BuyDecision never happened this turn"
+            if decisiontype is BuyDecision:
+                return state
+            game = game.current_player().make_decision(decisiontype(game))
 
     def take_turn(self):
         """
         Play an entire turn, including drawing cards at the end. Return
         the game state where it is the next player's turn.
         """
-        self.log.info("")
-        self.log.info("Round %d / player %d: %s" % (
-          (self.round + 1),
-          (self.player_turn+1), self.current_player().name
-        ))
+        turn = self.start_turn()
+        return self.end_turn(self.run_decisions(), turn)
 
-        self.log.info("%d provinces left" % self.card_counts[province])
-        
-        # Run AI hooks that need to happen before the turn.
-        self.current_player().before_turn(self)
-        endturn = self.run_decisions()
+    def turn_steps(self):
+        "The steps of take_turn; see run_steps."
+        turn = self.start_turn()
+        endturn = yield self.decision_steps()
+        yield self.end_turn(endturn, turn)
 
-        next_turn = (self.turn + 1)
+    def start_turn(self):
+        """
+        Do what happens at the start of a turn. Returns what end_turn needs
+        to know about the turn, in case this game changes in place.
+        """
+        for listener in self.listeners:
+            listener.turn_start(self)
+        player = self.current_player()
+        # Run AI hooks that need to happen before the turn.
+        player.before_turn(self)
+        return (player, self.player_turn, self.turn + 1)
 
-        newgame = Game(endturn.playerstates[:], endturn.card_counts,
-                       next_turn, self.simulated)
+    def end_turn(self, endturn, turn):
+        """
+        Clean up after the decisions of a turn, and return the game state
+        where it is the next player's turn.
+        """
+        player, player_turn, next_turn = turn
+        if self.in_place:
+            newgame = endturn
+            newgame.set_turn(next_turn)
+        else:
+            newgame = Game(endturn.playerstates[:], endturn.supply,
+                           next_turn, self.simulated,
+                           listeners=self.listeners)
         # mutate the new game object since nobody cares yet
-        newgame.playerstates[self.player_turn] =\
-          newgame.playerstates[self.player_turn].next_turn()
+        newgame.playerstates[player_turn] =\
+          newgame.playerstates[player_turn].next_turn()
 
         # Run AI hooks that need to happen after the turn.
-        self.current_player().after_turn(newgame)
+        player.after_turn(newgame)
         return newgame
 
+    def provinces_left(self):
+        return self.supply[province]
+
     def over(self):
         "Returns True if the game is over."
-        if self.card_counts[province] == 0: return True
-        zeros = 0
-        for count in self.card_counts.values():
-            if count == 0: zeros += 1
-        if self.num_players() > 4: return (zeros >= 4)
-        else: return (zeros >= 3)
+        supply = self.supply
+        if supply[province] == 0: return True
+        if self.num_players() > 4: return (supply.empty >= 4)
+        else: return (supply.empty >= 3)
 
-    def run(self):
+    def run_to_end(self):
         """
-        Play a game of Dominion. Return a dictionary mapping players to scores.
+        Play a game of Dominion, and return the final game state.
         """
         game = self
         while not game.over():
             game = game.take_turn()
-        scores = [(state.player, state.score()) for state in game.playerstates]
-        self.log.info("End of game.")
-        self.log.info("Scores: %s" % scores)
-        return scores
+        for listener in game.listeners:
+            listener.game_end(game)
+        return game
+
+    def game_steps(self):
+        """
+        The steps of run_to_end. This lets a game be played one decision at
+        a time; see driver.py.
+        """
+        game = self
+        while not game.over():
+            game = yield game.turn_steps()
+        for listener in game.listeners:
+            listener.game_end(game)
+        yield game
+
+    def run(self):
+        """
+        Play a game of Dominion. Return a list of (player, score) pairs.
+        """
+        game = self.run_to_end()
+        return [(state.player, state.score()) for state in game.playerstates]
+
+    def canonical_key(self, drawpile_order=False):
+        """
+        A hashable key for this position: the canonical_key of every
+        player's state, the supply, and whose turn it is. Positions that are
+        reached in different ways, or that only differ in the order of cards
+        where the order doesn't matter, get the same key. The turn number
+        isn't part of it, so bots that decide by the round can't share
+        results this way.
+        """
+        return (self.player_turn, self.supply.canonical_key(),
+                tuple([state.canonical_key(drawpile_order)
+                       for state in self.playerstates]))
 
     def __repr__(self):
         return 'Game%s[%s]' % (str(self.playerstates), str(self.turn))
 
 class Decision(object):
+    # the players.Budget for making this decision, if there is one
+    budget = None
+
     def __init__(self, game):
         self.game = game
     def state(self):
         return self.game.state()
     def player(self):
         return self.game.current_player()
+    def choose_steps(self, choice):
+        """
+        Like choose, but a choice that leads to more decisions returns the
+        steps that make them (see run_steps) instead of a Game.
+        """
+        return self.choose(choice)
 
 class MultiDecision(Decision):
     def __init__(self, game, min=0, max=INF):
@@ -622,17 +1872,23 @@ class MultiDecision(Decision):
 
 class ActDecision(Decision):
     def choices(self):
-        return [None] + [card for card in self.state().hand if card.isAction()]
+        return [None] + [card for card in self.state().hand if card.is_action]
     def choose(self, card):
-        self.game.log.info("%s plays %s" % (self.player().name, card))
         if card is None:
             newgame = self.game.change_current_state(
               delta_actions=-self.state().actions
             )
             return newgame
         else:
+            for listener in self.game.listeners:
+                listener.play(self.game, self.player(), card)
             newgame = card.perform_action(self.game.current_play_action(card))
             return newgame
+    def choose_steps(self, card):
+        if card is None: return self.choose(card)
+        for listener in self.game.listeners:
+            listener.play(self.game, self.player(), card)
+        return card.action_steps(self.game.current_play_action(card))
     def __str__(self):
         return "ActDecision (%d actions, %d buys, +%d coins)" %\
           (self.state().actions, self.state().buys, self.state().coins)
@@ -645,9 +1901,8 @@ class BuyDecision(Decision):
     def choices(self):
         assert self.coins() >= 0
         value = self.coins()
-        return [None] + [card for card in self.game.card_choices() if card.cost <= value]
+        return [None] + list(self.game.supply.affordable(value))
     def choose(self, card):
-        self.game.log.info("%s buys %s" % (self.player().name, card))
         state = self.state()
         if card is None:
             newgame = self.game.change_current_state(
@@ -655,6 +1910,8 @@ class BuyDecision(Decision):
             )
             return newgame
         else:
+            for listener in self.game.listeners:
+                listener.buy(self.game, self.player(), card)
             newgame = self.game.remove_card(card).replace_current_state(
               state.gain(card).change(delta_buys=-1, delta_coins=-card.cost)
             )
@@ -669,7 +1926,8 @@ class TrashDecision(MultiDecision):
         return sorted(list(self.state().hand))
 
     def choose(self, choices):
-        self.game.log.info("%s trashes %s" % (self.player().name, choices))
+        for listener in self.game.listeners:
+            listener.trash(self.game, self.player(), choices)
         state = self.state()
         for card in choices:
             state = state.trash_card(card)
@@ -683,7 +1941,8 @@ class DiscardDecision(MultiDecision):
         return sorted(list(self.state().hand))
     
     def choose(self, choices):
-        self.game.log.info("%s discards %s" % (self.player().name, choices))
+        for listener in self.game.listeners:
+            listener.discard(self.game, self.player(), choices)
         state = self.state()
         for card in choices:
             state = state.discard_card(card)
@@ -0,0 +1,179 @@
+"""
+Work out exactly how many coins and buys a hand will have.
+
+simulate_hands and simulate_hands_batch estimate this by drawing random
+hands. For decks made only of treasures, victory cards and actions without
+special effects (such as Village, Smithy, Market, Laboratory, Festival and
+Woodcutter), the distribution can instead be worked out exactly, with the
+multivariate hypergeometric distribution.
+
+Only the actions decide how many cards get drawn, so the enumeration keeps
+track of each action separately and lumps every other card together; the
+treasure in a hand only depends on how many of those other cards it has.
+Situations that come up more than once are only worked out once.
+
+As with simulate_hands_batch, the player is assumed to play actions in the
+order of BigMoney.act_priority.
+"""
+from game import registry
+
+HAND_SIZE = 5
+
+def supported(card):
+    "Can hands with this card in them be evaluated exactly?"
+    return not (card.is_action and card.effect)
+
+def act_priority(card):
+    "The same ordering as BigMoney.act_priority."
+    return (100*card.actions + 10*(card.coins + card.cards) + card.buys) + 1
+
+# binomials[n][k] is n choose k, for decks of up to MAX_CARDS cards
+MAX_CARDS = 200
+binomials = [[1]]
+for n in xrange(1, MAX_CARDS + 1):
+    row = binomials[-1]
+    binomials.append([1] + [row[k-1] + row[k] for k in xrange(1, n)] + [1])
+
+def draws(remaining, n):
+    """
+    Every way of drawing n cards from a multiset of `remaining` counts,
+    with its probability (the multivariate hypergeometric distribution).
+    Returns a list of pairs of (counts drawn, probability).
+    """
+    result = []
+    total = float(binomials[sum(remaining)][n])
+    last = len(remaining) - 1
+    def choose(k, n, drawn, ways):
+        if k == last:
+            if n <= remaining[k]:
+                result.append((drawn + (n,), ways * binomials[remaining[k]][n]
+                               / total))
+            return
+        row = binomials[remaining[k]]
+        for x in xrange(min(n, remaining[k]) + 1):
+            choose(k + 1, n - x, drawn + (x,), ways * row[x])
+    choose(0, n, (), 1)
+    return result
+
+def treasure_distributions(treasures, counts, most):
+    """
+    For each k up to `most`, the distribution of the total treasure of k
+    cards drawn from a pile with counts[i] cards worth treasures[i] each,
+    as a dictionary mapping coins to probabilities.
+    """
+    # ways[k][coins] is the number of ways to draw k cards worth that much
+    ways = [{0: 1}]
+    for treasure, count in zip(treasures, counts):
+        new = [{} for k in xrange(min(len(ways) + count, most + 1))]
+        for k, row in enumerate(ways):
+            for x in xrange(min(count, most - k) + 1):
+                for coins, w in row.iteritems():
+                    key = coins + x*treasure
+                    new[k+x][key] = (new[k+x].get(key, 0)
+                                     + w * binomials[count][x])
+        ways = new
+    total = sum(counts)
+    return [dict((coins, w / float(binomials[total][k]))
+                 for coins, w in row.iteritems())
+            for k, row in enumerate(ways)]
+
+def hand_distribution(deck_counts, top=()):
+    """
+    Get the probability distribution of the coins and buys of a fresh hand,
+    drawn from a deck given as a count vector (indexed by Card.index) with
+    the cards in `top` on top of it. This is the exact version of
+    `state.simulate_hands(n, top)`.
+
+    Returns a dictionary mapping (coins, buys) to probabilities, or None
+    if the deck has cards whose effects can't be evaluated this way.
+    """
+    cards = [registry[index] for index, count in enumerate(deck_counts)
+             if count]
+    top = list(top)
+    if not all(supported(card) for card in cards + top):
+        return None
+    if sum(deck_counts) > MAX_CARDS:
+        return None
+
+    # Only the actions decide how many cards are drawn, so the deck is
+    # split into one group per action, best first, and one group for
+    # everything else. A hand is a tuple of how many of each action it has.
+    actions = sorted(set(card for card in cards + top if card.is_action),
+                     key=lambda card: -act_priority(card))
+    deck = tuple([deck_counts[card.index] if card in cards else 0
+                  for card in actions] +
+                 [sum(deck_counts[card.index] for card in cards
+                      if not card.is_action)])
+    other = len(actions)
+    memo = {}
+
+    def draw(n, hand, remaining, drawn, left):
+        """
+        The distribution of (coins, buys, others) from drawing n cards and
+        then playing out the turn, where `others` is how many cards that
+        aren't actions were drawn from the deck. `drawn` is how many of the
+        top cards have been drawn, and `left` is the number of actions left.
+        """
+        key = (n, hand, remaining, drawn, left)
+        if key in memo: return memo[key]
+        coins = 0
+        hand = list(hand)
+        # the top cards come first, in order
+        while n and drawn < len(top):
+            card = top[drawn]
+            if card.is_action: hand[actions.index(card)] += 1
+            else: coins += card.treasure
+            drawn += 1
+            n -= 1
+        n = min(n, sum(remaining))
+        result = {}
+        for taken, p in draws(remaining, n):
+            newhand = tuple([h + t for h, t in zip(hand, taken)])
+            rest = tuple([r - t for r, t in zip(remaining, taken)])
+            for (c, b, k), q in play(newhand, rest, drawn, left).iteritems():
+                outcome = (c + coins, b, k + taken[other])
+                result[outcome] = result.get(outcome, 0.0) + p*q
+        memo[key] = result
+        return result
+
+    def play(hand, remaining, drawn, left):
+        """
+        Play out the actions in the hand, best first. Actions that don't
+        draw are played right away; the first one that draws continues
+        with draw().
+        """
+        coins = buys = 0
+        hand = list(hand)
+        while left > 0 and any(hand[:other]):
+            slot = [i for i, count in enumerate(hand) if count][0]
+            card = actions[slot]
+            hand[slot] -= 1
+            left += card.actions - 1
+            coins += card.coins
+            buys += card.buys
+            if card.cards:
+                rest = draw(card.cards, tuple(hand), remaining, drawn, left)
+                return dict(((c + coins, b + buys, k), q)
+                            for (c, b, k), q in rest.iteritems())
+        return {(coins, buys, 0): 1.0}
+
+    outcomes = draw(HAND_SIZE, (0,) * (other + 1), deck, 0, 1)
+
+    # Which of the other cards were drawn is a uniformly random sample of
+    # them, so their treasure only depends on how many there were.
+    others = [card for card in cards if not card.is_action]
+    most = max(k for coins, buys, k in outcomes)
+    treasure = treasure_distributions(
+      [card.treasure for card in others],
+      [deck_counts[card.index] for card in others], most)
+    result = {}
+    for (coins, buys, k), p in outcomes.iteritems():
+        for extra, q in treasure[k].iteritems():
+            outcome = (coins + extra, buys + 1)
+            result[outcome] = result.get(outcome, 0.0) + p*q
+    return result
+
+def expectation(distribution, func):
+    "The expected value of func(coins, buys) under a distribution."
+    return sum(p * func(coins, buys)
+               for (coins, buys), p in distribution.iteritems())
@@ -0,0 +1,141 @@
+"""
+Simulate many hands from the same deck at once, using NumPy.
+
+PlayerState.simulate_hands plays out every hand as a separate simulated
+Game. Most hands, though, contain nothing but treasures, victory cards and
+simple actions, and for those the number of coins and buys can be added up
+directly. This module draws all the hands as one matrix of card IDs, works
+out coins and buys for the simple ones in a single vectorized pass, and only
+plays out the rest as real simulated turns.
+"""
+from game import Game, PlayerState, DeckStats, registry, simulation_rng, \
+  simulation_supply, TREASURE, ACTIONS, BUYS, COINS
+import numpy as np
+
+HAND_SIZE = 5
+
+# card_arrays() for the cards registered so far
+_arrays = (0, None)
+
+def card_arrays():
+    """
+    Get the card table, and a boolean array of which cards are "simple"
+    actions: actions that draw no cards and have no special effect, so they
+    don't change which cards are in the hand.
+    """
+    global _arrays
+    size, arrays = _arrays
+    if size != len(registry):
+        simple = np.array([card.is_action and not card.cards and
+                           not card.effect for card in registry], dtype=bool)
+        is_action = registry.flags()[0]
+        arrays = (registry.table(), is_action, simple)
+        _arrays = (len(registry), arrays)
+    return arrays
+
+def card_objects():
+    "An array of the Card objects, to turn rows of card IDs back into cards."
+    return np.array(registry.cards + [None], dtype=object)[:-1]
+
+def numpy_rng(rng):
+    "Make a NumPy RandomState whose seed comes from a GameRandom."
+    return np.random.RandomState(simulation_rng(rng).getrandbits(32))
+
+def draw_orders(deck_counts, n, top=(), rs=np.random):
+    """
+    Shuffle a deck, given as a count vector, `n` times. Returns an n x D
+    matrix of card IDs in drawing order, with the cards in `top` placed on
+    top of every shuffled deck.
+    """
+    deck = np.repeat(np.arange(len(deck_counts)), deck_counts)
+    perm = np.argsort(rs.random_sample((n, len(deck))), axis=1)
+    orders = deck[perm]
+    if top:
+        top = np.array([card.index for card in top])
+        orders = np.hstack([np.tile(top, (n, 1)), orders])
+    return orders
+
+def simulate_hands_batch(state, n=100, cards=()):
+    """
+    The vectorized equivalent of `state.simulate_hands(n, cards)`: simulate n
+    fresh hands from this player's deck with certain cards on top, and
+    return two arrays giving the coins and buys each hand ends up with.
+
+    Hands whose actions are all simple are assumed to play every action
+    they can, in the order that BigMoney.act_priority would play them.
+    Hands containing actions that draw cards or have effects fall back to
+    playing a simulated turn, with the same drawpile.
+    """
+    orders = draw_orders(state.deck_counts(), n, cards, numpy_rng(state.rng))
+    return play_orders(state, orders)
+
+def simulate_swaps(state, hand, cards):
+    """
+    Simulate the turn played with `hand` on top of this player's deck, and
+    the turns played with each of `cards` swapped in for each card in it.
+    Every variation shares one shuffle of the rest of the deck.
+
+    Returns the coins and buys arrays for the unchanged hand, followed by
+    the swapped hands in row-major order: the hand with cards[j] in
+    position i is row 1 + j*len(hand) + i.
+    """
+    n = len(hand)
+    top = np.array([card.index for card in hand], dtype=int)
+    tops = np.tile(top, (1 + len(cards)*n, 1))
+    for j, card in enumerate(cards):
+        rows = 1 + j*n + np.arange(n)
+        tops[rows, np.arange(n)] = card.index
+    rest = draw_orders(state.deck_counts(), 1, (), numpy_rng(state.rng))
+    orders = np.hstack([tops, np.tile(rest, (len(tops), 1))])
+    return play_orders(state, orders)
+
+def play_orders(state, orders):
+    """
+    Play a turn from each row of a matrix of card IDs in drawing order, and
+    return arrays of the coins and buys that each one ends up with. See
+    simulate_hands_batch.
+    """
+    n = len(orders)
+    table, is_action, simple = card_arrays()
+    hands = orders[:, :HAND_SIZE]
+
+    coins = table[hands, TREASURE].sum(axis=1)
+    buys = np.ones(n, dtype=int)
+
+    # Non-terminal simple actions (Festival) can always be played first;
+    # then there are 1 + (their extra actions) left for terminal ones.
+    hand_actions = table[hands, ACTIONS]
+    played = is_action[hands]
+    nonterminal = played & (hand_actions > 0)
+    spare_actions = 1 + ((hand_actions - 1) * nonterminal).sum(axis=1)
+    terminals = (played & ~nonterminal).sum(axis=1)
+    complex_rows = ((played & ~simple[hands]).any(axis=1)
+                    | (terminals > spare_actions))
+
+    coins += (table[hands, COINS] * played).sum(axis=1)
+    buys += (table[hands, BUYS] * played).sum(axis=1)
+
+    # Rows that are the same, such as a card swapped in for a copy of
+    # itself, only need to be played once.
+    rows = np.flatnonzero(complex_rows)
+    if len(rows):
+        unique, first, inverse = np.unique(orders[rows], axis=0,
+                                           return_index=True,
+                                           return_inverse=True)
+        cards = card_objects()
+        results = [play_order(state, orders[row], cards)
+                   for row in rows[first]]
+        coins[rows], buys[rows] = np.array(results, dtype=int)[inverse.ravel()].T
+    return coins, buys
+
+def play_order(state, order, cards):
+    """
+    Play a simulated turn from a single row of card IDs, which are turned
+    into Cards using the array `cards`.
+    """
+    stats = DeckStats.of_counts(np.bincount(order, minlength=len(registry)))
+    order = tuple(cards[order])
+    newstate = PlayerState(state.player, order[:HAND_SIZE], order[HAND_SIZE:],
+                           (), (), 1, 1, 0, simulation_rng(state.rng), stats)
+    game = Game([newstate], simulation_supply(), simulated=True)
+    return game.simulate_turn()
@@ -0,0 +1,229 @@
+"""
+Play thousands of BigMoney games at once, in lockstep, using NumPy.
+
+BigMoney and bots like it only ever buy treasure and victory cards, and
+never have an action to play, so a turn is just: draw five cards, count
+their coins, and buy the best card that's affordable. This module keeps
+many such games as arrays -- the drawpile and discard pile of every player
+as vectors of card counts, and the supply of every game -- and plays one
+turn of every game with a handful of vectorized operations:
+
+    games = LockstepGames([BigMoney(), BigMoney(1, 2)], 100000, seed=0)
+    games.run()
+    games.scores        # games x bots
+    games.turns
+
+The games aren't the same as Game.run's game for game, because the decks
+are shuffled differently, but they follow the same rules, so the results
+agree statistically. Drawing from a count vector one card at a time, and
+moving the discard pile into the drawpile whenever it runs out, gives
+hands with the same distribution as shuffling.
+
+Any bot whose decisions are BigMoney's, apart from a buy_priority_order
+that depends only on the number of provinces left, can be played this way;
+supported() tells which ones.
+"""
+from game import VICTORY_CARDS, copper, silver, gold, estate, duchy, province
+from players import BigMoney
+import numpy as np
+
+HAND_SIZE = 5
+
+# The cards that these games can involve, and their columns in the arrays.
+CARDS = (copper, silver, gold, estate, duchy, province)
+COLUMN = dict((card, i) for i, card in enumerate(CARDS))
+PROVINCE = COLUMN[province]
+TREASURE = np.array([card.treasure for card in CARDS])
+COST = np.array([card.cost for card in CARDS])
+VP = np.array([card.vp for card in CARDS])
+
+class ProvinceDecision(object):
+    """
+    A stand-in for a BuyDecision, with nothing in it but the number of
+    provinces left, for asking a bot for its buy_priority_order.
+    """
+    def __init__(self, provinces):
+        self.game = self
+        self.supply = {province: provinces}
+
+def priority_table(bot, provinces):
+    """
+    Ask a bot for its buy priorities for every number of provinces left, up
+    to `provinces`. Returns an array of priorities indexed by provinces
+    left and card column (-1 for cards it won't buy), and an array of the
+    priority of buying nothing.
+
+    Raises ValueError if the bot could buy a card outside CARDS, or if its
+    priorities depend on more than the provinces left.
+    """
+    table = -np.ones((provinces + 1, len(CARDS)), dtype=int)
+    nothing = -np.ones(provinces + 1, dtype=int)
+    for left in xrange(provinces + 1):
+        try:
+            order = bot.buy_priority_order(ProvinceDecision(left))
+        except (AttributeError, KeyError, TypeError):
+            raise ValueError("%s's buy priorities depend on more than the "
+                             "provinces left" % bot)
+        for priority, card in enumerate(order):
+            if card is None:
+                nothing[left] = priority
+            elif card in COLUMN:
+                table[left, COLUMN[card]] = priority
+            else:
+                raise ValueError("%s can buy %s" % (bot, card))
+    return table, nothing
+
+# The methods that a bot must inherit from BigMoney (or Player) unchanged.
+BIG_MONEY_METHODS = ('make_decision', 'make_choice', 'make_buy_decision',
+                     'buy_priority', 'before_turn', 'after_turn')
+
+def supported(bot):
+    "Can this bot be played by LockstepGames?"
+    if not isinstance(bot, BigMoney): return False
+    cls = type(bot)
+    for name in BIG_MONEY_METHODS:
+        if getattr(cls, name).im_func is not getattr(BigMoney, name).im_func:
+            return False
+    try:
+        priority_table(bot, VICTORY_CARDS[2])
+    except ValueError:
+        return False
+    return True
+
+class LockstepGames(object):
+    """
+    `games` games between the same `bots`, played a turn at a time in every
+    game at once. The players are seated in a random order in each game,
+    unless `shuffle` is False. Kingdom cards don't make a difference, since
+    the bots never buy them and so their piles never run out.
+
+    After run(), `scores` holds each bot's final score in each game
+    (games x bots), `turns` the number of turns each game took, and `order`
+    the bot in each seat.
+    """
+    def __init__(self, bots, games, seed=None, shuffle=True):
+        for bot in bots:
+            if not supported(bot):
+                raise ValueError("%s can't be played in lockstep" % bot)
+        self.bots = list(bots)
+        self.games = games
+        nplayers = len(bots)
+        self.rs = np.random.RandomState(seed)
+        if shuffle:
+            keys = self.rs.random_sample((games, nplayers))
+            self.order = np.argsort(keys, axis=1)
+        else:
+            self.order = np.tile(np.arange(nplayers), (games, 1))
+
+        victory = VICTORY_CARDS[nplayers]
+        counts = {copper: 60 - 7*nplayers, silver: 40, gold: 30,
+                  estate: victory, duchy: victory, province: victory}
+        self.supply = np.tile([counts[card] for card in CARDS], (games, 1))
+        self.empty_limit = 4 if nplayers > 4 else 3
+
+        tables = [priority_table(bot, victory) for bot in bots]
+        self.priorities = np.array([table for table, nothing in tables])
+        self.nothing = np.array([nothing for table, nothing in tables])
+
+        # Everyone starts with 7 coppers and 3 estates in the discard pile,
+        # which get shuffled when they draw their first hand.
+        start = np.zeros(len(CARDS), dtype=int)
+        start[COLUMN[copper]] = 7
+        start[COLUMN[estate]] = 3
+        self.drawpile = np.zeros((games, nplayers, len(CARDS)), dtype=int)
+        self.discard = np.tile(start, (games, nplayers, 1))
+        self.turn = 0
+        self.turns = np.zeros(games, dtype=int)
+        self.active = np.ones(games, dtype=bool)
+
+    def done(self):
+        return not self.active.any()
+
+    def draw(self, drawpile, discard, n=HAND_SIZE):
+        """
+        Draw n cards in each row of `drawpile`, shuffling the discard pile
+        in when it runs out. Changes both arrays in place and returns the
+        hands.
+        """
+        rows = np.arange(len(drawpile))
+        hands = np.zeros_like(drawpile)
+        for i in xrange(n):
+            total = drawpile.sum(axis=1)
+            out = total == 0
+            if out.any():
+                drawpile[out] += discard[out]
+                discard[out] = 0
+                total = drawpile.sum(axis=1)
+            position = self.rs.random_sample(len(rows)) * total
+            card = (drawpile.cumsum(axis=1) <= position[:, None]).sum(axis=1)
+            drew = total > 0
+            card = np.minimum(card, len(CARDS) - 1)
+            hands[rows[drew], card[drew]] += 1
+            drawpile[rows[drew], card[drew]] -= 1
+        return hands
+
+    def step(self):
+        """
+        Play one turn in every game that isn't over. Returns the indices of
+        the games that played it.
+        """
+        live = np.flatnonzero(self.active)
+        seat = self.turn % len(self.bots)
+        bot = self.order[live, seat]
+        drawpile = self.drawpile[live, seat]
+        discard = self.discard[live, seat]
+        supply = self.supply[live]
+
+        hands = self.draw(drawpile, discard)
+        coins = hands.dot(TREASURE)
+
+        # buy the card with the best priority that's affordable and left
+        provinces = supply[:, PROVINCE]
+        priorities = self.priorities[bot, provinces]
+        buyable = (COST[None, :] <= coins[:, None]) & (supply > 0)
+        priorities = np.where(buyable, priorities, -1)
+        choice = priorities.argmax(axis=1)
+        buying = np.flatnonzero(priorities.max(axis=1) >
+                                self.nothing[bot, provinces])
+        discard[buying, choice[buying]] += 1
+        supply[buying, choice[buying]] -= 1
+        discard += hands
+
+        self.drawpile[live, seat] = drawpile
+        self.discard[live, seat] = discard
+        self.supply[live] = supply
+        self.turn += 1
+        over = ((supply[:, PROVINCE] == 0) |
+                ((supply == 0).sum(axis=1) >= self.empty_limit))
+        self.turns[live[over]] = self.turn
+        self.active[live[over]] = False
+        return live
+
+    def run(self, max_turns=1000):
+        """
+        Play every game to the end, or until `max_turns` turns have gone by.
+        """
+        while not self.done() and self.turn < max_turns:
+            self.step()
+        self.turns[self.active] = self.turn
+        return self
+
+    def deck_counts(self, seat):
+        "Count vectors (games x CARDS) of everything each player in a seat has."
+        return self.drawpile[:, seat] + self.discard[:, seat]
+
+    def deck_values(self, seat):
+        """
+        The value of the deck of the player in a seat in each game, as in
+        baseline.state_value: the total cost of the cards minus their number.
+        """
+        return self.deck_counts(seat).dot(COST - 1)
+
+    @property
+    def scores(self):
+        "Each bot's score in each game, indexed by bot (not seat)."
+        seat_scores = (self.drawpile + self.discard).dot(VP)
+        scores = np.zeros_like(seat_scores)
+        rows = np.arange(self.games)[:, None]
+        scores[rows, self.order] = seat_scores
+        return scores
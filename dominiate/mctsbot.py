@@ -0,0 +1,277 @@
+"""
+A bot that chooses its actions and buys by Monte Carlo tree search.
+
+Every iteration of the search starts from Game.simulated_copy of the
+current game, so the cards that the bot can't see -- the order of its
+drawpile and everyone else's cards -- are sampled afresh each time. The
+tree covers the bot's own choices for the rest of this turn; after them,
+the game is played out by a fast rollout policy (BigMoney by default)
+taking every player's seat, and the result is backed up the tree. Choices
+are picked by UCT, and the one that was tried the most is played -- if it
+was tried clearly more than the rollout policy's own choice, which is
+played otherwise, since a small budget gives only a few dozen iterations.
+
+Because the hidden cards change from one iteration to the next, a node of
+the tree stands for a sequence of choices, not a particular game state
+("open-loop" search). After the bot makes a choice, the node under it is
+kept, so the search for the next decision in the same turn starts with
+what it has already learned.
+
+Each decision runs until its budget runs out: `time_limit` seconds of wall
+clock time, `iterations` iterations, the deadline of the decision's
+players.Budget, or whichever comes first.
+"""
+from game import Game, ActDecision, BuyDecision, simulation_rng
+from players import BigMoney
+import copy
+import logging
+import math
+import random
+import time
+
+class Node(object):
+    """
+    A node of the search tree: how often it has been visited, the total
+    reward of those visits, and a child for each choice that has been tried.
+    Children are keyed by the kind of decision and the choice, since which
+    decision comes next can depend on the sampled cards.
+    """
+    __slots__ = ('visits', 'total', 'children')
+
+    def __init__(self):
+        self.visits = 0
+        self.total = 0.0
+        self.children = {}
+
+    def mean(self):
+        if not self.visits: return 0.0
+        return self.total / self.visits
+
+    def select(self, kind, choices, exploration, widening):
+        """
+        Pick one of `choices` for a decision of type `kind` by UCT. The
+        choices should be in order of how promising they look. Only the
+        first 1 + widening * sqrt(visits) of them are considered, so that
+        a small budget isn't spread over every card in the supply, and
+        choices that haven't been tried come first.
+        """
+        best = None
+        best_score = None
+        log_visits = math.log(max(self.visits, 1))
+        allowed = 1 + int(widening * math.sqrt(self.visits))
+        for choice in choices[:allowed]:
+            child = self.children.get((kind, choice))
+            if child is None or not child.visits:
+                return choice
+            score = child.mean() + exploration * math.sqrt(log_visits /
+                                                           child.visits)
+            if best_score is None or score > best_score:
+                best, best_score = choice, score
+        return best
+
+    def best_choice(self, kind, choices, separation=0.0):
+        """
+        The choice that was tried the most, breaking ties by reward and
+        then by the order of `choices`.
+
+        Unless it was tried more often than the first choice, the one the
+        rollout policy would make, by `separation` times the square root
+        of their visits together, the first choice is returned instead:
+        a few visits either way are noise, not evidence.
+        """
+        def key(choice):
+            child = self.children.get((kind, choice))
+            if child is None: return (0, 0.0)
+            return (child.visits, child.mean())
+        best = max(choices, key=key)
+        default = choices[0]
+        best_visits = key(best)[0]
+        default_visits = key(default)[0]
+        if (best_visits - default_visits <
+            separation * math.sqrt(best_visits + default_visits)):
+            return default
+        return best
+
+class MCTSBot(BigMoney):
+    """
+    Search for each ActDecision and BuyDecision with up to `iterations`
+    iterations or `time_limit` seconds; with neither, the limit is 0.1
+    seconds. Rollouts go on for `rollout_turns` turns, or to the end of the game if
+    that's None, with `rollout_bot` making everyone's decisions. Other
+    decisions, such as what to trash, are made the BigMoney way. The
+    search only overrules the rollout policy when its choice was visited
+    more by `separation` standard deviations (see Node.best_choice).
+
+    A finished rollout is worth 1 for a win, 0.5 for a tie and 0 for a loss.
+    One that stops before the end of the game is scored by the lead in
+    victory points instead, squashed into the same range.
+    """
+    def __init__(self, time_limit=None, iterations=None, rollout_turns=None,
+                 exploration=0.7, widening=1.0, rollout_bot=None, cutoff1=3,
+                 cutoff2=6, separation=2.0):
+        if time_limit is None and iterations is None:
+            time_limit = 0.1
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.rollout_turns = rollout_turns
+        self.exploration = exploration
+        self.widening = widening
+        self.separation = separation
+        if rollout_bot is None:
+            rollout_bot = BigMoney(cutoff1, cutoff2)
+        self.rollout_bot = rollout_bot
+        if not hasattr(self, 'name'):
+            if iterations is None:
+                self.name = 'MCTSBot(%ss)' % time_limit
+            else:
+                self.name = 'MCTSBot(%d)' % iterations
+        # the subtree to start the next search from, and the turn and
+        # random number generator of the player it's for, which tell games
+        # apart
+        self._reuse = (None, None, None)
+        BigMoney.__init__(self, cutoff1, cutoff2)
+
+    def make_act_decision(self, decision):
+        return self.search(decision)
+
+    def make_buy_decision(self, decision):
+        return self.search(decision)
+
+    def ordered_choices(self, decision):
+        """
+        The choices of a decision, most promising first, as the search
+        should try them. Actions go in the order that BigMoney plays them.
+        Buys go in BigMoney's order of preference, then by cost, with
+        buying nothing after every card that costs something.
+        """
+        choices = decision.choices()
+        if isinstance(decision, ActDecision):
+            key = lambda card: -self.act_priority(decision, card)
+        else:
+            def key(card):
+                if card is None: return (1, 0, 0)
+                return (card.cost == 0, -self.buy_priority(decision, card),
+                        -card.cost)
+        choices.sort(key=key)
+        return choices
+
+    def search(self, decision):
+        "Run a search from `decision`, and return the choice to make."
+        choices = self.ordered_choices(decision)
+        kind = type(decision)
+        game = decision.game
+        rng = decision.state().rng
+        if len(choices) == 1:
+            self._reuse = (None, None, None)
+            return choices[0]
+        turn, reuse_rng, root = self._reuse
+        if turn != game.turn or reuse_rng is not rng or root is None:
+            root = Node()
+
+        base = simulation_rng(rng).getrandbits(32)
+        deadline = None
+        if self.time_limit is not None:
+            deadline = time.time() + self.time_limit
+        budget = decision.budget
+        if budget is not None and budget.deadline is not None:
+            deadline = min(deadline or budget.deadline, budget.deadline)
+        iterations = 0
+        while True:
+            if self.iterations is not None and iterations >= self.iterations:
+                break
+            if deadline is not None and iterations and time.time() > deadline:
+                break
+            self.iterate(root, decision, base)
+            iterations += 1
+
+        choice = root.best_choice(kind, choices, self.separation)
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("%s: %d iterations, %s", decision, iterations,
+                           ', '.join('%s %d/%.2f' % (c, child.visits,
+                                                     child.mean())
+                                     for (k, c), child in
+                                     root.children.items() if k is kind))
+        self._reuse = (game.turn, rng, root.children.get((kind, choice)))
+        return choice
+
+    def rollout_game(self, game, seed):
+        """
+        Sample the hidden information in a game, and hand every seat to the
+        rollout bot. The sample, and every shuffle after it, comes from
+        random number generators seeded with `seed`.
+        """
+        states = []
+        for i, state in enumerate(game.playerstates):
+            state = copy.copy(state)
+            state.player = self.rollout_bot
+            state.rng = random.Random(hash((seed, i)))
+            states.append(state)
+        return Game(states, game.supply, game.turn).simulated_copy()
+
+    def iterate(self, root, decision, base):
+        """
+        Run one iteration of the search, and update the tree with it.
+
+        The k-th visit to each choice at the root sees the k-th sample of
+        the hidden cards (seeded with `base` and k), so the choices are
+        compared on the same deals, and luck mostly cancels out.
+        """
+        seat = decision.game.player_turn
+        kind = type(decision)
+        choice = root.select(kind, self.ordered_choices(decision),
+                             self.exploration, self.widening)
+        child = root.children.get((kind, choice))
+        world = 0
+        if child is not None: world = child.visits
+        game = self.rollout_game(decision.game, (base, world))
+        current = kind(game)
+        node = root
+        path = [root]
+        while True:
+            child = node.children.get((kind, choice))
+            expanded = child is None
+            if expanded:
+                child = node.children[kind, choice] = Node()
+            path.append(child)
+            game = current.choose(choice)
+            # let the rollout bot make any other decisions, until the next
+            # one that belongs in the tree or the end of the turn
+            decisiontype = game.state().next_decision()
+            while decisiontype not in (None, ActDecision, BuyDecision):
+                game = game.current_player().make_decision(decisiontype(game))
+                decisiontype = game.state().next_decision()
+            if decisiontype is None or expanded:
+                break
+            node = child
+            kind = decisiontype
+            current = kind(game)
+            choice = node.select(kind, self.ordered_choices(current),
+                                 self.exploration, self.widening)
+
+        reward = self.rollout(game, seat)
+        for node in path:
+            node.visits += 1
+            node.total += reward
+
+    def rollout(self, game, seat):
+        """
+        Finish the current turn, play on with the rollout bot, and return
+        the reward for the player in `seat`.
+        """
+        turn = (game.current_player(), game.player_turn, game.turn + 1)
+        game = game.end_turn(game.run_decisions(), turn)
+        turns = 0
+        while not game.over():
+            if self.rollout_turns is not None and turns >= self.rollout_turns:
+                break
+            game = game.take_turn()
+            turns += 1
+        mine = game.playerstates[seat].score()
+        others = [state.score() for i, state in enumerate(game.playerstates)
+                  if i != seat]
+        best = max(others + [0])
+        if others and game.over():
+            if mine > best: return 1.0
+            elif mine == best: return 0.5
+            else: return 0.0
+        return 0.5 + 0.5 * math.tanh((mine - best) / 10.0)
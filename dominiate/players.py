@@ -1,6 +1,7 @@
 from game import Game, BuyDecision, ActDecision, TrashDecision, DiscardDecision, MultiDecision, INF
 import cards as c
 import logging
+import time
 
 class Player(object):
     def __init__(self, *args):
@@ -10,6 +11,17 @@ class Player(object):
         raise NotImplementedError
     def make_multi_decision(self, decision, state):
         raise NotImplementedError
+    def make_decisions(self, decisions):
+        """
+        Make a batch of decisions from different games (see
+        driver.run_games), returning for each one either the choice, as
+        the decision's choose() takes it, or the resulting Game. A choice
+        lets the driver carry it out a step at a time, so the decisions
+        that come up along the way, such as what to trash with a Chapel,
+        come back to the driver too; a Game has already made them. Players
+        that can evaluate many decisions together should override this.
+        """
+        return [self.make_decision(decision) for decision in decisions]
     def __str__(self):
         return self.name
     def __repr__(self):
@@ -80,13 +92,58 @@ class HumanPlayer(Player):
         return BigMoney()
 
 
+class Budget(object):
+    """
+    How long a bot may spend on a decision: until `deadline`, a time.time()
+    value, or `seconds` from now. A budget with neither never runs out.
+
+    Bots that can trade accuracy for time, such as HillClimbBot and MCTSBot,
+    check it with remaining() or expired() and stop early; the rest ignore
+    it.
+    """
+    def __init__(self, seconds=None, deadline=None):
+        if deadline is None and seconds is not None:
+            deadline = time.time() + seconds
+        self.deadline = deadline
+
+    def remaining(self):
+        "Seconds left, or None if there is no limit."
+        if self.deadline is None: return None
+        return max(self.deadline - time.time(), 0.0)
+
+    def expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def __repr__(self):
+        return "<Budget: %s seconds left>" % self.remaining()
+
 class AIPlayer(Player):
+    # the time each decision may take, in seconds, when make_decision isn't
+    # given a budget; None means no limit
+    move_time = None
+
     def __init__(self):
         self.log = logging.getLogger(self.name)
     def setLogLevel(self, level):
         self.log.setLevel(level)
-    def make_decision(self, decision):
-        self.log.debug("Decision: %s" % decision)
+    def make_decision(self, decision, budget=None):
+        "Make a decision and return the resulting Game."
+        return decision.choose(self.make_choice(decision, budget))
+
+    def make_decisions(self, decisions):
+        return [self.make_choice(decision) for decision in decisions]
+
+    def make_choice(self, decision, budget=None):
+        """
+        Decide what to choose, without carrying it out. The `budget`, or one
+        of `move_time` seconds, is attached to the decision as
+        decision.budget, so the methods that decide, such as buy_priority,
+        can see it.
+        """
+        if budget is None and self.move_time is not None:
+            budget = Budget(self.move_time)
+        decision.budget = budget
+        self.log.debug("Decision: %s", decision)
         if isinstance(decision, BuyDecision):
             choice = self.make_buy_decision(decision)
         elif isinstance(decision, ActDecision):
@@ -97,7 +154,7 @@ class AIPlayer(Player):
             choice = self.make_trash_decision(decision)
         else:
             raise NotImplementedError
-        return decision.choose(choice)
+        return choice
 
 class BigMoney(AIPlayer):
     """
@@ -117,7 +174,7 @@ class BigMoney(AIPlayer):
         Provide a buy_priority by ordering the cards from least to most
         important.
         """
-        provinces_left = decision.game.card_counts[c.province]
+        provinces_left = decision.game.supply[c.province]
         if provinces_left <= self.cutoff1:
             return [None, c.estate, c.silver, c.duchy, c.province]
         elif provinces_left <= self.cutoff2:
@@ -167,8 +224,7 @@ class BigMoney(AIPlayer):
     
     def make_trash_decision_incremental(self, decision, choices, allow_none=True):
         "Choose a single card to trash."
-        deck = decision.state().all_cards()
-        money = sum([card.treasure + card.coins for card in deck])
+        money = decision.state().total_money()
         if c.curse in choices:
             return c.curse
         elif c.copper in choices and money > 3:
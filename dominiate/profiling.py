@@ -0,0 +1,252 @@
+"""
+Find out where the time goes in a game.
+
+A Profiler, while it is installed, wraps the methods that make up a game --
+Player.make_decision (and the before_turn/after_turn hooks),
+Game.run_decisions, Game.simulate_turn, Game.simulate_partial_turn and
+Card.perform_action -- and records how long each call takes. Times are kept
+separately for each player, each kind of decision and each card, and the
+profiler counts how many simulated games each decision starts.
+
+    with Profiler() as profiler:
+        game.run()
+    print profiler.summary()
+
+Nothing is wrapped unless a profiler is installed, so this costs nothing
+the rest of the time.
+"""
+from game import Game, Card
+from players import Player
+from collections import defaultdict
+import math
+import time
+
+class Timing(object):
+    """
+    The number of calls to something, their total and maximum time, and a
+    histogram of their times in buckets that are powers of two
+    microseconds.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = defaultdict(int)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max: self.max = seconds
+        self.buckets[bucket(seconds)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        for b, count in other.buckets.items():
+            self.buckets[b] += count
+
+    def mean(self):
+        if not self.count: return 0.0
+        return self.total / self.count
+
+def bucket(seconds):
+    "Which power of two microseconds a time falls under."
+    microseconds = max(seconds * 1e6, 1.0)
+    return int(math.ceil(math.log(microseconds, 2)))
+
+def format_key(key):
+    return ' / '.join(key)
+
+def all_subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        for subsubclass in all_subclasses(subclass):
+            yield subsubclass
+
+class Profiler(object):
+    """
+    Records timings for the parts of a game. See the module docstring.
+
+    Profilers can be merged, so that each worker process in a tournament can
+    keep its own and send it back to be added up.
+    """
+    def __init__(self):
+        self.timings = defaultdict(Timing)
+        self.simulated_games = defaultdict(int)
+        self._context = []
+        self._depth = defaultdict(int)
+        self._patches = []
+
+    def __getstate__(self):
+        # only the results travel between processes
+        return {'timings': dict(self.timings),
+                'simulated_games': dict(self.simulated_games)}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.timings.update(state['timings'])
+        self.simulated_games.update(state['simulated_games'])
+
+    def merge(self, other):
+        for key, timing in other.timings.items():
+            self.timings[key].merge(timing)
+        for key, count in other.simulated_games.items():
+            self.simulated_games[key] += count
+
+    def reset(self):
+        self.timings.clear()
+        self.simulated_games.clear()
+
+    # Installing the wrappers
+
+    def _patch(self, cls, name, make_wrapper):
+        original = cls.__dict__[name]
+        self._patches.append((cls, name, original))
+        setattr(cls, name, make_wrapper(original))
+
+    def install(self):
+        assert not self._patches, "This profiler is already installed"
+        for cls in [Player] + list(all_subclasses(Player)):
+            if 'make_decision' in cls.__dict__:
+                self._patch(cls, 'make_decision', self._wrap_decision)
+            for hook in ('before_turn', 'after_turn'):
+                if hook in cls.__dict__:
+                    self._patch(cls, hook, self._wrap_hook)
+        self._patch(Game, 'run_decisions', self._wrap_game_method)
+        self._patch(Game, 'simulate_turn', self._wrap_simulation)
+        self._patch(Game, 'simulate_partial_turn', self._wrap_simulation)
+        self._patch(Card, 'perform_action', self._wrap_action)
+        return self
+
+    def uninstall(self):
+        for cls, name, original in reversed(self._patches):
+            setattr(cls, name, original)
+        self._patches = []
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+    # The wrappers
+
+    def _timed(self, key, func, args, context=False):
+        if context: self._context.append(key)
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            self.timings[key].add(time.time() - start)
+            if context: self._context.pop()
+
+    def _wrap_decision(self, original):
+        profiler = self
+        def make_decision(player, decision, *args):
+            # a player class may hand the same decision to its superclass
+            context = profiler._context
+            if context and context[-1][-1] is decision:
+                return original(player, decision, *args)
+            if decision.game.simulated: kind = 'simulated decision'
+            else: kind = 'decision'
+            key = (kind, player.name, decision.__class__.__name__)
+            profiler._context.append(key + (decision,))
+            start = time.time()
+            try:
+                return original(player, decision, *args)
+            finally:
+                profiler.timings[key].add(time.time() - start)
+                profiler._context.pop()
+        return make_decision
+
+    def _wrap_hook(self, original):
+        profiler = self
+        def hook(player, game):
+            key = (original.__name__, player.name)
+            return profiler._timed(key, original, (player, game), True)
+        return hook
+
+    def _wrap_action(self, original):
+        profiler = self
+        def perform_action(card, game):
+            return profiler._timed(('effect', card.name), original,
+                                   (card, game))
+        return perform_action
+
+    def _wrap_game_method(self, original):
+        """
+        Time the outermost call of a recursive Game method, such as
+        run_decisions.
+        """
+        profiler = self
+        name = original.__name__
+        def method(game, *args):
+            if profiler._depth[name]:
+                return original(game, *args)
+            profiler._depth[name] += 1
+            try:
+                key = (name, game.current_player().name)
+                return profiler._timed(key, original, (game,) + args)
+            finally:
+                profiler._depth[name] -= 1
+        return method
+
+    def _wrap_simulation(self, original):
+        "Like _wrap_game_method, but also count the simulated games."
+        timed = self._wrap_game_method(original)
+        profiler = self
+        name = original.__name__
+        def method(game, *args):
+            if not profiler._depth[name]:
+                if profiler._context:
+                    context = tuple(profiler._context[-1][:3])
+                else:
+                    context = ('top level',)
+                profiler.simulated_games[context] += 1
+            return timed(game, *args)
+        return method
+
+    # Reports
+
+    def summary(self, limit=None):
+        """
+        A table of everything that was timed, with the most total time
+        first, followed by the number of simulated games each decision
+        started.
+        """
+        rows = sorted(self.timings.items(), key=lambda item: -item[1].total)
+        if limit is not None: rows = rows[:limit]
+        lines = ['%-60s %9s %10s %10s %10s' % ('', 'Calls', 'Total s',
+                                                'Mean ms', 'Max ms')]
+        for key, timing in rows:
+            lines.append('%-60s %9d %10.3f %10.3f %10.3f' % (
+              format_key(key)[:60], timing.count, timing.total,
+              1000*timing.mean(), 1000*timing.max
+            ))
+        if self.simulated_games:
+            lines.append('')
+            lines.append('%-60s %9s' % ('Simulated games started by', 'Games'))
+            for key, count in sorted(self.simulated_games.items(),
+                                     key=lambda item: -item[1]):
+                lines.append('%-60s %9d' % (format_key(key)[:60], count))
+        return '\n'.join(lines)
+    __str__ = summary
+
+    def histogram(self, key, width=50):
+        "A text histogram of the times recorded for one key."
+        timing = self.timings[key]
+        if not timing.count: return '%s: no calls' % format_key(key)
+        lines = [format_key(key)]
+        biggest = max(timing.buckets.values())
+        for b in xrange(min(timing.buckets), max(timing.buckets) + 1):
+            count = timing.buckets.get(b, 0)
+            lines.append('%10s us %8d %s' % (
+              '<= %d' % (2**b), count, '#' * (width * count // biggest)
+            ))
+        return '\n'.join(lines)
+
+    def histograms(self, limit=3):
+        "Histograms for the `limit` keys with the most total time."
+        rows = sorted(self.timings.items(), key=lambda item: -item[1].total)
+        return '\n\n'.join(self.histogram(key) for key, t in rows[:limit])
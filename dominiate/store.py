@@ -0,0 +1,219 @@
+"""
+Keep the result of every game of a tournament on disk.
+
+A ResultStore is a directory of chunks. Each chunk is a directory holding
+one .npy file per column, so the results can be memory-mapped and analyzed
+with NumPy without reading them all into memory:
+
+    store = ResultStore('results/smithy')
+    scores = store.column('scores')      # games x bots
+    turns = store.column('turns')
+
+The columns are:
+
+    game     the game's index in the tournament
+    seed     the game's seed
+    order    the index of the bot in each seat
+    kingdom  an index into the store's list of kingdoms (see kingdoms())
+    scores   the final score of each bot, indexed by bot
+    turns    the total number of turns
+    winner   the index of the winning bot, or -1 for a tie
+
+Results are appended as games finish, and written a chunk at a time. A
+chunk is written under a temporary name and renamed when it is complete,
+so an interrupted run leaves only complete chunks behind. Opening the same
+directory again resumes it: run_tournament skips the games that are
+already in the store.
+"""
+import numpy as np
+import json
+import os
+import shutil
+
+COLUMNS = ('game', 'seed', 'order', 'kingdom', 'scores', 'turns', 'winner')
+
+def column_types(nbots):
+    "The dtype and shape of one record of each column."
+    return {'game': ('int64', ()), 'seed': ('int64', ()),
+            'order': ('int8', (nbots,)), 'kingdom': ('int16', ()),
+            'scores': ('int16', (nbots,)), 'turns': ('int16', ()),
+            'winner': ('int8', ())}
+
+def winner(scores):
+    "The index of the best score, or -1 if there's a tie for the best."
+    best = max(scores)
+    winners = [i for i, score in enumerate(scores) if score == best]
+    if len(winners) == 1: return winners[0]
+    return -1
+
+class ResultStore(object):
+    """
+    An append-only store of game results in `directory`, for a tournament
+    between bots with the given names. See the module docstring.
+
+    The names of the bots are recorded when the store is created, and when
+    an existing store is opened, `bots` must match them. Settings that
+    decide which game gets which seed are recorded with setting().
+    """
+    def __init__(self, directory, bots=None, chunk_size=10000):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as infile:
+                self.meta = json.load(infile)
+            if bots is not None and list(bots) != self.meta['bots']:
+                raise ValueError("This store has results for %s, not %s"
+                                 % (self.meta['bots'], list(bots)))
+        else:
+            if bots is None:
+                raise ValueError("A new store needs the names of the bots")
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.meta = {'bots': list(bots), 'settings': {}, 'kingdoms': []}
+            self._save_meta()
+        self.types = column_types(len(self.meta['bots']))
+        self.chunk_count = len(self.chunk_names())
+        self._buffer = dict((name, []) for name in COLUMNS)
+        self._done = None
+
+    @property
+    def bots(self):
+        return self.meta['bots']
+
+    def setting(self, name, value=None):
+        """
+        Get a setting of the run, such as its seed. If it hasn't been set
+        yet, it's set to `value`. If it has, and `value` is something else,
+        the results wouldn't belong together, so this raises ValueError.
+        """
+        settings = self.meta['settings']
+        if settings.get(name) is None:
+            settings[name] = value
+            self._save_meta()
+        elif value is not None and value != settings[name]:
+            raise ValueError("This store was started with %s=%r, not %r"
+                             % (name, settings[name], value))
+        return settings[name]
+
+    def kingdoms(self):
+        "The kingdoms that have been used, as lists of card names."
+        return self.meta['kingdoms']
+
+    def _save_meta(self):
+        path = os.path.join(self.directory, 'meta.json')
+        with open(path + '.tmp', 'w') as out:
+            json.dump(self.meta, out, indent=2)
+        os.rename(path + '.tmp', path)
+
+    def kingdom_index(self, var_cards):
+        "Get the index of a kingdom, adding it to the list if it's new."
+        names = sorted(card.name for card in var_cards)
+        if names not in self.meta['kingdoms']:
+            self.meta['kingdoms'].append(names)
+            self._save_meta()
+        return self.meta['kingdoms'].index(names)
+
+    # Writing
+
+    def append(self, result, kingdom=0):
+        """
+        Add the result of a game, as returned by tournament.play_game. The
+        record is written to disk when its chunk is full, or on flush().
+        """
+        record = {'game': result['game'], 'seed': result['seed'],
+                  'order': result['order'], 'kingdom': kingdom,
+                  'scores': result['scores'], 'turns': result['turns'],
+                  'winner': winner(result['scores'])}
+        for name in COLUMNS:
+            self._buffer[name].append(record[name])
+        if self._done is not None:
+            self._mark_done(result['game'])
+        if len(self._buffer['game']) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        "Write the results that have been appended as a new chunk."
+        if not self._buffer['game']: return
+        name = 'chunk-%06d' % self.chunk_count
+        temp = os.path.join(self.directory, name + '.tmp')
+        if os.path.exists(temp):
+            shutil.rmtree(temp)
+        os.makedirs(temp)
+        for column in COLUMNS:
+            dtype, shape = self.types[column]
+            data = np.array(self._buffer[column], dtype=dtype)
+            np.save(os.path.join(temp, column + '.npy'), data)
+            self._buffer[column] = []
+        os.rename(temp, os.path.join(self.directory, name))
+        self.chunk_count += 1
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Reading
+
+    def chunk_names(self):
+        "The complete chunks, in the order they were written."
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith('chunk-')
+                      and not name.endswith('.tmp'))
+
+    def column_chunks(self, column, mmap_mode='r'):
+        "Memory-map a column of each chunk in turn."
+        for name in self.chunk_names():
+            yield np.load(os.path.join(self.directory, name, column + '.npy'),
+                          mmap_mode=mmap_mode)
+
+    def column(self, column):
+        "Read a whole column from every chunk into one array."
+        dtype, shape = self.types[column]
+        chunks = list(self.column_chunks(column))
+        if not chunks: return np.zeros((0,) + shape, dtype=dtype)
+        return np.concatenate(chunks)
+
+    def __len__(self):
+        "The number of games written to disk."
+        return sum(len(chunk) for chunk in self.column_chunks('game'))
+
+    def records(self):
+        """
+        Iterate over the stored games as dictionaries, in the format that
+        tournament.play_game returns.
+        """
+        for name in self.chunk_names():
+            path = os.path.join(self.directory, name)
+            columns = [np.load(os.path.join(path, column + '.npy'),
+                               mmap_mode='r') for column in COLUMNS]
+            for values in zip(*columns):
+                record = dict(zip(COLUMNS, values))
+                yield {'game': int(record['game']),
+                       'seed': int(record['seed']),
+                       'order': record['order'].tolist(),
+                       'scores': record['scores'].tolist(),
+                       'turns': int(record['turns'])}
+
+    def _mark_done(self, game):
+        if game >= len(self._done):
+            grown = np.zeros(max(game + 1, 2*len(self._done)), dtype=bool)
+            grown[:len(self._done)] = self._done
+            self._done = grown
+        self._done[game] = True
+
+    def has(self, game):
+        "Has the game with this index been stored (or appended)?"
+        if self._done is None:
+            games = self.column('game')
+            size = 1
+            if len(games): size = games.max() + 1
+            self._done = np.zeros(size, dtype=bool)
+            self._done[games] = True
+            for game_index in self._buffer['game']:
+                self._mark_done(game_index)
+        return game < len(self._done) and self._done[game]
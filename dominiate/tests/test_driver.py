@@ -0,0 +1,56 @@
+"""
+driver.run_games must play the same games as Game.run_to_end.
+
+Run from the dominiate directory with:
+
+    python -m unittest discover -s tests
+"""
+from game import Game
+from driver import run_games
+from combobot import ComboBot
+from derivbot import DerivBot
+from players import BigMoney
+import cards as c
+import unittest
+
+def scores(game):
+    return [state.score() for state in game.playerstates]
+
+class RunGamesTest(unittest.TestCase):
+    def setup_games(self, players, seeds):
+        return [Game.setup(players(), c.variable_cards, seed=seed,
+                           listeners=())
+                for seed in seeds]
+
+    def assertSameGames(self, players, seeds):
+        ends = run_games(self.setup_games(players, seeds))
+        expected = [game.run_to_end()
+                    for game in self.setup_games(players, seeds)]
+        self.assertEqual([scores(game) for game in ends],
+                         [scores(game) for game in expected])
+        self.assertEqual([game.turn for game in ends],
+                         [game.turn for game in expected])
+
+    def test_fresh_players(self):
+        # Chapel, Cellar, Militia and Warehouse lead to decisions in the
+        # middle of an action, which the driver batches too
+        def players():
+            return [ComboBot([(c.chapel, 0), (c.cellar, 0), (c.militia, 2),
+                              (c.warehouse, 3)], name='chapel'),
+                    ComboBot([(c.militia, 0), (c.smithy, 2)], name='smithy')]
+        self.assertSameGames(players, range(12))
+
+    def test_shared_players(self):
+        # the same bots sit in every game, so their decisions from
+        # different games are interleaved
+        bots = [ComboBot([(c.militia, 0), (c.smithy, 2)], name='smithy'),
+                ComboBot([(c.chapel, 0), (c.council_room, 2)], name='chapel')]
+        self.assertSameGames(lambda: bots, range(12))
+
+    def test_rejects_shared_turn_hooks(self):
+        bot = DerivBot(2)
+        games = self.setup_games(lambda: [bot, BigMoney()], range(2))
+        self.assertRaises(ValueError, run_games, games)
+
+if __name__ == '__main__':
+    unittest.main()
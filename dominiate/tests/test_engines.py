@@ -0,0 +1,203 @@
+"""
+The engine modes of Game.setup must play the same games as the default.
+
+Shared and in-place games are the same game for game, so their positions
+are compared turn by turn with Game.canonical_key. Multiset games shuffle
+the discard pile in a different order, and lazy games use the random
+numbers in a different order, so their games are compared statistically,
+and multiset states are checked exactly on turns that don't reshuffle.
+Everything is seeded, so the statistical checks give the same answer
+every time.
+"""
+from game import Game, GameRandom, MultisetPlayerState, count_vector
+from players import BigMoney
+from basic_ai import SmithyBot
+from combobot import ComboBot
+import cards as c
+import math
+import unittest
+
+def bots():
+    # Chapel, Militia and Moat take the engine through trashing, attacks
+    # and defenses as well as drawing and buying
+    return [SmithyBot(),
+            ComboBot([(c.chapel, 0), (c.militia, 2), (c.laboratory, 3)],
+                     name='chapel'),
+            ComboBot([(c.moat, 0), (c.council_room, 2), (c.cellar, 3)],
+                     name='moat')]
+
+def turns(game):
+    "Every position of a game, from the start to the end."
+    yield game
+    while not game.over():
+        game = game.take_turn()
+        yield game
+
+def mean_and_error(values):
+    n = len(values)
+    mean = float(sum(values)) / n
+    variance = sum((x - mean) ** 2 for x in values) / (n - 1)
+    return mean, math.sqrt(variance / n)
+
+def check_stats(test, state):
+    "The running totals of a state must match its cards."
+    cards = state.all_cards()
+    test.assertEqual(state.deck_size(), len(cards))
+    test.assertEqual(state.score(), sum(card.vp for card in cards))
+    test.assertEqual(state.total_money(),
+                     sum(card.treasure + card.coins for card in cards))
+    test.assertEqual(list(state.deck_counts()[:len(count_vector())]),
+                     list(count_vector(cards)))
+    if hasattr(state, 'undrawn'):
+        # looking at a lazy drawpile would decide the order of all of it
+        test.assertEqual(state.drawpile_size(), len(state.undrawn()))
+    else:
+        test.assertEqual(state.drawpile_size(), len(state.drawpile))
+
+class EngineTest(unittest.TestCase):
+    seeds = range(8)
+
+    def assertSameGames(self, **mode):
+        players = bots()
+        for seed in self.seeds:
+            default = Game.setup(players, c.variable_cards, seed=seed,
+                                 listeners=())
+            other = Game.setup(players, c.variable_cards, seed=seed,
+                               listeners=(), **mode)
+            # an in-place game changes under the iterator, so each
+            # position's key is taken before moving on
+            expected = [game.canonical_key(drawpile_order=True)
+                        for game in turns(default)]
+            keys = []
+            for game in turns(other):
+                keys.append(game.canonical_key(drawpile_order=True))
+                for state in game.playerstates:
+                    check_stats(self, state)
+            self.assertEqual(keys, expected)
+
+    def assertSameMeans(self, values, expected, z=3.0):
+        mean, error = mean_and_error(values)
+        expected_mean, expected_error = mean_and_error(expected)
+        self.assertLess(abs(mean - expected_mean),
+                        z * math.hypot(error, expected_error))
+
+    def play(self, games, **mode):
+        "The final score of the first bot and the length of each game."
+        scores, lengths = [], []
+        for seed in xrange(games):
+            players = [BigMoney(), SmithyBot()]
+            final = Game.setup(players, c.variable_cards, seed=seed,
+                               listeners=(), **mode).run_to_end()
+            scores.append([state.score() for state in final.playerstates
+                           if state.player is players[0]][0])
+            lengths.append(final.turn)
+        return scores, lengths
+
+class SetupTest(unittest.TestCase):
+    def test_one_mode_at_most(self):
+        modes = ['in_place', 'multiset', 'shared', 'lazy']
+        for first in modes:
+            for second in modes:
+                if first == second: continue
+                flags = {first: True, second: True}
+                self.assertRaises(ValueError, Game.setup, [BigMoney()],
+                                  listeners=(), **flags)
+
+class SharedTest(EngineTest):
+    def test_same_games(self):
+        self.assertSameGames(shared=True)
+
+class InPlaceTest(EngineTest):
+    def test_same_games(self):
+        self.assertSameGames(in_place=True)
+
+    def test_fork(self):
+        # looking ahead from a fork must not change the real game
+        players = bots()
+        default = Game.setup(players, c.variable_cards, seed=3, listeners=())
+        game = Game.setup(players, c.variable_cards, seed=3, listeners=(),
+                          in_place=True)
+        for i in xrange(9):
+            default = default.take_turn()
+            game = game.take_turn()
+            fork = game.fork()
+            # the fork only keeps what the current player can see
+            self.assertFalse(fork.in_place)
+            self.assertEqual(sorted(fork.state().hand),
+                             sorted(game.state().hand))
+            self.assertEqual(fork.supply.canonical_key(),
+                             game.supply.canonical_key())
+            self.assertEqual([state.deck_counts()
+                              for state in fork.playerstates],
+                             [state.deck_counts()
+                              for state in game.playerstates])
+            for j in xrange(3):
+                if not fork.over(): fork = fork.take_turn()
+            self.assertEqual(game.canonical_key(drawpile_order=True),
+                             default.canonical_key(drawpile_order=True))
+
+class MultisetTest(EngineTest):
+    def to_multiset(self, game):
+        "A copy of a default game whose states are MultisetPlayerStates."
+        states = []
+        for state in game.playerstates:
+            rng = GameRandom()
+            rng.setstate(state.rng.getstate())
+            rng.simulation.setstate(state.rng.simulation.getstate())
+            states.append(MultisetPlayerState(
+              state.player, count_vector(state.hand), state.drawpile,
+              count_vector(state.discard), count_vector(state.tableau),
+              state.actions, state.buys, state.coins, rng,
+              stats=state.stats))
+        return Game(states, game.supply, game.turn)
+
+    def test_same_turns(self):
+        # from the same position, a turn that doesn't reshuffle anyone's
+        # deck (and so doesn't use their random number generators) must
+        # come out the same
+        players = bots()
+        compared = 0
+        for seed in self.seeds:
+            for game in turns(Game.setup(players, c.variable_cards,
+                                         seed=seed, listeners=())):
+                if game.over(): break
+                multiset = self.to_multiset(game)
+                self.assertEqual(multiset.canonical_key(drawpile_order=True),
+                                 game.canonical_key(drawpile_order=True))
+                rng_states = [state.rng.getstate()
+                              for state in game.playerstates]
+                after = game.take_turn()
+                if rng_states != [state.rng.getstate()
+                                  for state in after.playerstates]:
+                    continue
+                multiset = multiset.take_turn()
+                self.assertEqual(multiset.canonical_key(drawpile_order=True),
+                                 after.canonical_key(drawpile_order=True))
+                for state in multiset.playerstates:
+                    check_stats(self, state)
+                compared += 1
+        self.assertGreater(compared, 100)
+
+    def test_same_results(self):
+        scores, lengths = self.play(300)
+        multiset_scores, multiset_lengths = self.play(300, multiset=True)
+        self.assertSameMeans(multiset_scores, scores)
+        self.assertSameMeans(multiset_lengths, lengths)
+
+class LazyTest(EngineTest):
+    def test_consistent(self):
+        players = bots()
+        for seed in self.seeds:
+            for game in turns(Game.setup(players, c.variable_cards,
+                                         seed=seed, listeners=(), lazy=True)):
+                for state in game.playerstates:
+                    check_stats(self, state)
+
+    def test_same_results(self):
+        scores, lengths = self.play(300)
+        lazy_scores, lazy_lengths = self.play(300, lazy=True)
+        self.assertSameMeans(lazy_scores, scores)
+        self.assertSameMeans(lazy_lengths, lengths)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+The exact hand distributions of handdist.py must match sampled hands.
+"""
+from game import PlayerState, LazyPlayerState, LazyPile, GameRandom, \
+  push_cards
+from handdist import hand_distribution
+from handsim import simulate_hands_batch
+from players import BigMoney
+import cards as c
+import math
+import unittest
+
+DECK = ((c.copper,)*7 + (c.estate,)*3 + (c.silver,)*3 + (c.gold,)*2 +
+        (c.village, c.smithy, c.market, c.laboratory, c.festival))
+
+class HandDistributionTest(unittest.TestCase):
+    def setUp(self):
+        self.state = PlayerState(BigMoney(), (), (), DECK, (),
+                                 rng=GameRandom(5))
+
+    def assertMatches(self, exact, samples):
+        "Each outcome's frequency must be within 4 standard errors."
+        n = float(len(samples))
+        counts = {}
+        for outcome in samples:
+            counts[outcome] = counts.get(outcome, 0) + 1
+        self.assertTrue(set(counts) <= set(exact))
+        for outcome, p in exact.items():
+            error = math.sqrt(p * (1 - p) / n)
+            self.assertLess(abs(counts.get(outcome, 0) / n - p),
+                            4 * error + 1e-9, outcome)
+
+    def test_total(self):
+        exact = hand_distribution(self.state.deck_counts(), (c.silver,))
+        self.assertAlmostEqual(sum(exact.values()), 1.0)
+
+    def test_unsupported(self):
+        deck = self.state.deck_counts()
+        self.assertEqual(hand_distribution(deck, (c.militia,)), None)
+
+    def test_simulate_hands(self):
+        for top in ((), (c.smithy,), (c.gold,)):
+            exact = hand_distribution(self.state.deck_counts(), top)
+            samples = list(self.state.simulate_hands(2000, top))
+            self.assertMatches(exact, samples)
+
+    def test_simulate_hands_batch(self):
+        for top in ((), (c.village,), (c.silver,)):
+            exact = hand_distribution(self.state.deck_counts(), top)
+            coins, buys = simulate_hands_batch(self.state, 20000, top)
+            self.assertMatches(exact, zip(coins.tolist(), buys.tolist()))
+
+    def test_lazy_hands(self):
+        # a lazy state shuffles the drawpile only as far as it's drawn
+        rng = GameRandom(7)
+        lazy = LazyPlayerState(BigMoney(), (), LazyPile(DECK[:8], rng), 0,
+                               push_cards(DECK[8:]), len(DECK) - 8, (),
+                               rng=rng)
+        for top in ((), (c.smithy,)):
+            exact = hand_distribution(lazy.deck_counts(), top)
+            samples = list(lazy.simulate_hands(2000, top))
+            self.assertMatches(exact, samples)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+"""
+LockstepGames must agree statistically with games played by Game.
+"""
+from game import Game
+from lockstep import LockstepGames, supported
+from players import BigMoney
+from basic_ai import SmithyBot
+import math
+import unittest
+
+class LockstepTest(unittest.TestCase):
+    def test_supported(self):
+        self.assertTrue(supported(BigMoney(1, 2)))
+        self.assertFalse(supported(SmithyBot()))
+
+    def test_same_results(self):
+        bots = [BigMoney(), BigMoney(1, 2)]
+        lockstep = LockstepGames(bots, 2000, seed=0).run()
+        scores = [[] for bot in bots]
+        lengths = []
+        for seed in xrange(300):
+            final = Game.setup(bots, seed=seed, listeners=()).run_to_end()
+            for state in final.playerstates:
+                scores[bots.index(state.player)].append(state.score())
+            lengths.append(final.turn)
+
+        def compare(values, expected):
+            n, m = len(values), float(len(expected))
+            mean = float(sum(values)) / n
+            expected_mean = sum(expected) / m
+            error = math.sqrt(
+              sum((x - mean) ** 2 for x in values) / (n - 1) / n +
+              sum((x - expected_mean) ** 2 for x in expected) / (m - 1) / m)
+            self.assertLess(abs(mean - expected_mean), 3.0 * error)
+
+        for i in xrange(len(bots)):
+            compare(list(lockstep.scores[:, i]), scores[i])
+        compare(list(lockstep.turns), lengths)
+
+if __name__ == '__main__':
+    unittest.main()
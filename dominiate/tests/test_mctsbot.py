@@ -0,0 +1,35 @@
+from game import BuyDecision
+from mctsbot import Node
+import cards as c
+import unittest
+
+def tree(visits):
+    "A root whose children were visited as often as `visits` says."
+    root = Node()
+    for card, count in visits:
+        child = root.children[BuyDecision, card] = Node()
+        child.visits = count
+        child.total = 0.5 * count
+        root.visits += count
+    return root
+
+class BestChoiceTest(unittest.TestCase):
+    choices = [c.gold, c.smithy, None]
+
+    def test_most_visited(self):
+        root = tree([(c.gold, 4), (c.smithy, 6), (None, 1)])
+        self.assertEqual(root.best_choice(BuyDecision, self.choices),
+                         c.smithy)
+
+    def test_close_visits_fall_back(self):
+        root = tree([(c.gold, 4), (c.smithy, 6), (None, 1)])
+        self.assertEqual(root.best_choice(BuyDecision, self.choices, 2.0),
+                         c.gold)
+
+    def test_clear_visits_win(self):
+        root = tree([(c.gold, 10), (c.smithy, 40), (None, 1)])
+        self.assertEqual(root.best_choice(BuyDecision, self.choices, 2.0),
+                         c.smithy)
+
+if __name__ == '__main__':
+    unittest.main()
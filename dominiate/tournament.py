@@ -0,0 +1,398 @@
+"""
+Play many games between bots, spread over a pool of worker processes.
+
+Each game gets its own seed, and the bots take turns sitting in each seat,
+so that nobody gets an advantage from going first. Results are aggregated
+as the games finish.
+
+In paired mode, each seed is played once for every rotation of the seats,
+so every bot plays with exactly the same shuffles and seatings as the
+others. These common random numbers cancel out much of the luck of the
+draw, so a difference between bots shows up in far fewer games.
+
+From the command line:
+
+    python tournament.py -n 1000 -j 8 BigMoney SmithyBot "HillClimbBot(2, 3, 40)"
+    python tournament.py -n 200 --paired BigMoney SmithyBot
+    python tournament.py -n 100 --move-time 0.05 "HillClimbBot(2, 3, 100)" MCTSBot
+"""
+from game import Game
+from cards import variable_cards
+from profiling import Profiler
+from store import ResultStore
+from collections import defaultdict
+from multiprocessing import Pool, cpu_count
+import itertools
+import random
+import math
+import time
+
+class TournamentResults(object):
+    """
+    Running totals of a tournament: wins, ties, scores and game lengths for
+    each bot, indexed by the bot's position in the list of bots.
+
+    It also keeps track of each bot's score margin (its score minus the
+    average of its opponents' scores), averaged over each group of
+    `group_size` games that share a seed. In a paired tournament the groups
+    contain every seating of the same shuffles, so the standard error of the
+    margin is much smaller than in an unpaired one.
+    """
+    def __init__(self, bots, group_size=1, profile=False):
+        self.bots = bots
+        self.group_size = group_size
+        self.profiler = None
+        if profile: self.profiler = Profiler()
+        self.games = 0
+        self.wins = [0] * len(bots)
+        self.ties = [0] * len(bots)
+        self.first_seat_wins = [0] * len(bots)
+        self.total_scores = [0] * len(bots)
+        self.total_turns = 0
+        self.start_time = time.time()
+
+        # partial sums of margins for groups that haven't finished yet
+        self._groups = {}
+        self.groups = 0
+        self.margin_sums = [0.0] * len(bots)
+        self.margin_squares = [0.0] * len(bots)
+
+    def add(self, result):
+        """
+        Add the result of a single game, as returned by play_game().
+        """
+        scores = result['scores']
+        best = max(scores)
+        winners = [i for i, score in enumerate(scores) if score == best]
+        for i in winners:
+            if len(winners) == 1:
+                self.wins[i] += 1
+            else:
+                self.ties[i] += 1
+        # the winner if ties go to whoever sits earliest
+        first = [i for i in result['order'] if i in winners][0]
+        self.first_seat_wins[first] += 1
+        for i, score in enumerate(scores):
+            self.total_scores[i] += score
+        self.total_turns += result['turns']
+        self.games += 1
+        if self.profiler is not None and 'profile' in result:
+            self.profiler.merge(result['profile'])
+        self._add_margins(result['seed'], scores)
+
+    def _add_margins(self, seed, scores):
+        n = len(scores)
+        total = sum(scores)
+        if n == 1:
+            margins = list(scores)
+        else:
+            margins = [score - float(total - score) / (n - 1)
+                       for score in scores]
+        count, sums = self._groups.get(seed, (0, [0.0] * n))
+        count += 1
+        sums = [s + m for s, m in zip(sums, margins)]
+        if count < self.group_size:
+            self._groups[seed] = (count, sums)
+            return
+        self._groups.pop(seed, None)
+        self.groups += 1
+        for i, s in enumerate(sums):
+            mean = s / count
+            self.margin_sums[i] += mean
+            self.margin_squares[i] += mean * mean
+
+    def margin(self, i):
+        """
+        Get the average score margin of a bot over its opponents, and the
+        standard error of that average.
+        """
+        if not self.groups: return 0.0, 0.0
+        mean = self.margin_sums[i] / self.groups
+        if self.groups < 2: return mean, 0.0
+        variance = ((self.margin_squares[i] - self.groups * mean * mean)
+                    / (self.groups - 1))
+        return mean, math.sqrt(max(variance, 0.0) / self.groups)
+
+    def win_rate(self, i):
+        if not self.games: return 0.0
+        return float(self.wins[i]) / self.games
+
+    def average_score(self, i):
+        if not self.games: return 0.0
+        return float(self.total_scores[i]) / self.games
+
+    def average_turns(self):
+        "The average number of turns each player takes in a game."
+        if not self.games: return 0.0
+        return float(self.total_turns) / self.games / len(self.bots)
+
+    def win_counts(self, break_ties=False):
+        """
+        A dictionary mapping each bot to its number of wins. Tied games
+        count for nobody, unless `break_ties` is True, in which case they go
+        to the tied bot that sat earliest.
+        """
+        counts = defaultdict(int)
+        if break_ties: wins = self.first_seat_wins
+        else: wins = self.wins
+        for bot, wins in zip(self.bots, wins):
+            counts[bot] += wins
+        return counts
+
+    def summary(self):
+        elapsed = time.time() - self.start_time
+        lines = ["%-32s %7s %7s %7s %9s %15s" % ('Bot', 'Wins', 'Ties',
+                                                 'Win %', 'Avg score',
+                                                 'Margin')]
+        for i, bot in enumerate(self.bots):
+            lines.append("%-32s %7d %7d %6.1f%% %9.2f %+7.2f +- %5.2f" % (
+              (bot.name, self.wins[i], self.ties[i], 100*self.win_rate(i),
+               self.average_score(i)) + self.margin(i)
+            ))
+        lines.append("%d games, %.1f turns per player, %.1f games/s" % (
+          self.games, self.average_turns(), self.games / max(elapsed, 1e-9)
+        ))
+        return '\n'.join(lines)
+    __str__ = summary
+
+def seating(game_index, nbots):
+    """
+    Which bot sits in each seat in a given game. The seating rotates from
+    game to game, so each bot spends the same number of games in each seat.
+    """
+    return [(game_index + seat) % nbots for seat in xrange(nbots)]
+
+class WorkerPool(object):
+    """
+    Run a function over many tasks on a pool of `processes` worker
+    processes (by default, one per CPU), or in this process if `processes`
+    is 1. Each worker, or this process, first calls
+    `initializer(*initargs)`, which sets up whatever the function needs in
+    module globals, so it isn't sent along with every task:
+
+        pool = WorkerPool(processes, _init_worker, (bots, var_cards))
+        try:
+            for result in pool.imap(play_game, tasks):
+                ...
+        finally:
+            pool.close()
+    """
+    def __init__(self, processes, initializer, initargs=()):
+        if processes is None:
+            processes = cpu_count()
+        self.pool = None
+        if processes == 1:
+            initializer(*initargs)
+        else:
+            self.pool = Pool(processes, initializer, initargs)
+
+    def imap(self, func, tasks, chunksize=1, ordered=True):
+        """
+        Iterate over func(task) for each task, in the order of `tasks`, or
+        in the order they finish if `ordered` is False.
+        """
+        if self.pool is None:
+            return itertools.imap(func, tasks)
+        elif ordered:
+            return self.pool.imap(func, tasks, chunksize)
+        else:
+            return self.pool.imap_unordered(func, tasks, chunksize)
+
+    def close(self):
+        "Stop the workers, whether or not they have finished."
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+# The bots and kingdom cards used by play_game in this process. They're set
+# when a worker process starts, instead of being sent along with every game.
+_bots = None
+_var_cards = None
+_profiler = None
+
+def _init_worker(bots, var_cards, profile=False):
+    global _bots, _var_cards, _profiler
+    _bots = bots
+    _var_cards = var_cards
+    if profile and _profiler is None:
+        _profiler = Profiler().install()
+
+def play_game(task):
+    """
+    Play a single game of a tournament. `task` is a tuple of
+    (game_index, seed, order), where `order` is the list of bot indices in
+    seating order.
+
+    Returns a dictionary with the game's index and seed, the seating order,
+    the final scores indexed by bot, and the total number of turns. If this
+    process is profiling, the game's Profiler is included as 'profile'.
+    """
+    game_index, seed, order = task
+    result = play_seated(_bots, _var_cards, seed, order)
+    result['game'] = game_index
+    if _profiler is not None:
+        profile = Profiler()
+        profile.merge(_profiler)
+        _profiler.reset()
+        result['profile'] = profile
+    return result
+
+def play_seated(bots, var_cards, seed, order):
+    """
+    Play a game between some bots, seated in the given order, and return
+    a dictionary of the seed, the order, the final scores indexed by bot,
+    and the total number of turns.
+    """
+    players = [bots[i] for i in order]
+    game = Game.setup(players, var_cards, shuffle=False, seed=seed,
+                      listeners=())
+    final = game.run_to_end()
+    scores = [0] * len(bots)
+    for seat, state in enumerate(final.playerstates):
+        scores[order[seat]] = state.score()
+    return {'seed': seed, 'order': order, 'scores': scores,
+            'turns': final.turn}
+
+def make_tasks(games, nbots, seed, paired=False):
+    """
+    Make the (game_index, seed, order) tuples for a tournament. In paired
+    mode, each seed is used for `nbots` consecutive games, one for each
+    rotation of the seats.
+    """
+    for i in xrange(games):
+        if paired:
+            yield (i, seed + i // nbots, seating(i, nbots))
+        else:
+            yield (i, seed + i, seating(i, nbots))
+
+def run_tournament(bots, games=100, processes=None, var_cards=variable_cards,
+                   seed=None, callback=None, chunksize=1, paired=False,
+                   profile=False, store=None):
+    """
+    Play `games` games between a list of bots, using a pool of `processes`
+    worker processes (by default, one per CPU). Returns a TournamentResults.
+
+    If `paired` is True, the games are played in groups that use the same
+    seed for every rotation of the seats (see the module docstring). So
+    that every group is complete, `games` is then rounded up to a multiple
+    of the number of bots.
+
+    If `profile` is True, every game is timed with a Profiler (see
+    profiling.py), and the merged profile is available as
+    `results.profiler`.
+
+    `callback`, if given, is called with the TournamentResults after each
+    game finishes. With `processes=1`, the games are played in this process
+    instead of a pool.
+
+    If a ResultStore (see store.py) is given, every game's result is
+    written to it. A store that already has results resumes the
+    tournament: those games count towards the results, and aren't played
+    again.
+    """
+    if store is not None:
+        seed = store.setting('seed', seed)
+        store.setting('paired', paired)
+        kingdom = store.kingdom_index(var_cards)
+    if seed is None:
+        seed = random.randrange(2**31)
+        if store is not None: store.setting('seed', seed)
+    if paired:
+        games = -(-games // len(bots)) * len(bots)
+        group_size = len(bots)
+    else: group_size = 1
+    results = TournamentResults(bots, group_size, profile)
+    tasks = make_tasks(games, len(bots), seed, paired)
+    if store is not None:
+        for record in store.records():
+            if record['game'] < games: results.add(record)
+        tasks = (task for task in tasks if not store.has(task[0]))
+        def add(result):
+            store.append(result, kingdom)
+            results.add(result)
+    else:
+        add = results.add
+
+    global _profiler
+    pool = WorkerPool(processes, _init_worker, (bots, var_cards, profile))
+    try:
+        for result in pool.imap(play_game, tasks, chunksize, ordered=False):
+            add(result)
+            if callback is not None: callback(results)
+    finally:
+        pool.close()
+        # only set if the games were played in this process
+        if _profiler is not None:
+            _profiler.uninstall()
+            _profiler = None
+        if store is not None: store.flush()
+    return results
+
+def bot_namespace():
+    "The names that can be used when describing bots on the command line."
+    import players, basic_ai, combobot, derivbot, mctsbot
+    namespace = {}
+    for module in (players, basic_ai, combobot, derivbot, mctsbot):
+        namespace.update(vars(module))
+    return namespace
+
+def parse_bot(spec, namespace):
+    """
+    Make a bot out of a description such as "SmithyBot" or
+    "HillClimbBot(2, 3, 40)".
+    """
+    bot = eval(spec, namespace)
+    if isinstance(bot, type):
+        bot = bot()
+    return bot
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+      description='Play a tournament between Dominion bots.'
+    )
+    parser.add_argument('bots', nargs='+', metavar='BOT',
+      help='a bot, such as BigMoney or "HillClimbBot(2, 3, 40)"')
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--paired', action='store_true',
+      help='play every seating of each seed (common random numbers)')
+    parser.add_argument('--profile', action='store_true',
+      help='time the decisions, and print where the time went')
+    parser.add_argument('--progress', type=int, default=0, metavar='N',
+      help='print the standings every N games')
+    parser.add_argument('--store', metavar='DIR',
+      help='save every result in this directory, resuming from what is there')
+    parser.add_argument('--move-time', type=float, default=None,
+      metavar='SECONDS',
+      help='the time each bot may spend on a decision, for bots that can '
+           'stop early')
+    args = parser.parse_args(argv)
+
+    namespace = bot_namespace()
+    bots = [parse_bot(spec, namespace) for spec in args.bots]
+    if args.move_time is not None:
+        for bot in bots:
+            bot.move_time = args.move_time
+    def progress(results):
+        if args.progress and results.games % args.progress == 0:
+            print results
+            print
+    store = None
+    if args.store:
+        store = ResultStore(args.store, [bot.name for bot in bots])
+    results = run_tournament(bots, args.games, args.processes,
+                             seed=args.seed, callback=progress,
+                             paired=args.paired, profile=args.profile,
+                             store=store)
+    print results
+    if results.profiler is not None:
+        print
+        print results.profiler.summary()
+        print
+        print results.profiler.histograms()
+
+if __name__ == '__main__':
+    main()
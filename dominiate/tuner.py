@@ -0,0 +1,221 @@
+"""
+Search for the best constructor parameters of a bot, such as the cutoffs of
+BigMoney or SmithyBot, by successive halving.
+
+Every configuration in a grid plays a few games against an opponent. The
+better half (or 1/eta) of them survive to the next round, where they play
+eta times as many games, and so on until one is left. Weak configurations
+are dropped after a handful of games, so most of the games go to telling
+the good ones apart.
+
+All the configurations play the same seeds, and each seed is played once
+from each seat, so differences in luck mostly cancel out (see the paired
+mode of tournament.py). Games are spread over a pool of worker processes.
+
+    python tuner.py SmithyBot cutoff1=2,3,4 cutoff2=5,6,7 cards_per_smithy=6,8,10
+"""
+from tournament import TournamentResults, WorkerPool, play_seated, \
+  bot_namespace, parse_bot
+from players import BigMoney
+from cards import variable_cards
+import itertools
+import random
+import math
+
+def expand_grid(grid):
+    """
+    Turn a dictionary mapping each parameter name to a list of values into
+    a list of keyword-argument dictionaries, one for each combination.
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*[grid[name] for name in names])]
+
+class Candidate(object):
+    """
+    One configuration being tuned: its parameters, its bot, its results
+    against the opponent so far, and the round it was dropped in (None if
+    it is still in the race).
+    """
+    def __init__(self, params, bot, opponent):
+        self.params = params
+        self.bot = bot
+        self.results = TournamentResults([bot, opponent], group_size=2)
+        self.dropped = None
+
+    def margin(self):
+        "The average score margin over the opponent, and its standard error."
+        return self.results.margin(0)
+
+    def interval(self, z=1.96):
+        "A confidence interval for the margin; 1.96 gives 95%."
+        mean, error = self.margin()
+        return mean - z*error, mean + z*error
+
+class Tuning(object):
+    """
+    The state of a search: every candidate, and how many rounds and games
+    have been played.
+    """
+    def __init__(self, candidates, opponent):
+        self.candidates = candidates
+        self.opponent = opponent
+        self.rounds = 0
+        self.seeds = 0
+
+    def alive(self):
+        return [candidate for candidate in self.candidates
+                if candidate.dropped is None]
+
+    def ranked(self):
+        """
+        The candidates, best first: those that lasted more rounds come
+        before those that were dropped earlier, and within a round they are
+        ordered by margin.
+        """
+        def key(candidate):
+            if candidate.dropped is None: lasted = self.rounds + 1
+            else: lasted = candidate.dropped
+            return (-lasted, -candidate.margin()[0])
+        return sorted(self.candidates, key=key)
+
+    def best(self):
+        return self.ranked()[0]
+
+    def summary(self, limit=None):
+        lines = ['%-32s %6s %7s %16s %19s %6s' % (
+          'Bot', 'Games', 'Win %', 'Margin', '95% interval', 'Round'
+        )]
+        ranked = self.ranked()
+        if limit is not None: ranked = ranked[:limit]
+        for candidate in ranked:
+            mean, error = candidate.margin()
+            low, high = candidate.interval()
+            if candidate.dropped is None: lasted = 'final'
+            else: lasted = str(candidate.dropped)
+            lines.append('%-32s %6d %6.1f%% %+7.2f +- %5.2f [%+7.2f, %+7.2f] %6s'
+                         % (candidate.bot.name[:32], candidate.results.games,
+                            100*candidate.results.win_rate(0), mean, error,
+                            low, high, lasted))
+        lines.append('against %s, %d rounds, %d seeds' % (
+          self.opponent.name, self.rounds, self.seeds))
+        return '\n'.join(lines)
+    __str__ = summary
+
+# The bots and kingdom cards used by play_candidate in this process, set
+# when a worker process starts.
+_bots = None
+_opponent = None
+_var_cards = None
+
+def _init_worker(bots, opponent, var_cards):
+    global _bots, _opponent, _var_cards
+    _bots = bots
+    _opponent = opponent
+    _var_cards = var_cards
+
+def play_candidate(task):
+    """
+    Play one game of a tuning run. `task` is (candidate index, seed, order),
+    where `order` is [0, 1] if the candidate goes first and [1, 0] if the
+    opponent does. Returns the candidate index and the game's result, as
+    returned by tournament.play_seated.
+    """
+    index, seed, order = task
+    return index, play_seated([_bots[index], _opponent], _var_cards, seed,
+                              order)
+
+def tune(bot_class, grid, opponent=None, games=8, eta=2,
+         var_cards=variable_cards, processes=None, seed=None, callback=None,
+         chunksize=4):
+    """
+    Find good parameters for `bot_class` among the combinations in `grid`,
+    a dictionary mapping each constructor argument to a list of values.
+    Returns a Tuning, whose ranked() candidates and summary() table show
+    the results.
+
+    In the first round each configuration plays `games` games against
+    `opponent` (by default BigMoney()), half of them from each seat. After
+    each round only the best 1/`eta` are kept, and they play `eta` times as
+    many new games in the next. `callback`, if given, is called with the
+    Tuning after each round, including the last.
+    """
+    if opponent is None:
+        opponent = BigMoney()
+    if seed is None:
+        seed = random.randrange(2**31)
+    candidates = [Candidate(params, bot_class(**params), opponent)
+                  for params in expand_grid(grid)]
+    tuning = Tuning(candidates, opponent)
+    bots = [candidate.bot for candidate in candidates]
+
+    pool = WorkerPool(processes, _init_worker, (bots, opponent, var_cards))
+    try:
+        alive = range(len(candidates))
+        seeds = max(games // 2, 1)
+        while True:
+            tasks = [(index, seed + tuning.seeds + i, order)
+                     for index in alive
+                     for i in xrange(seeds)
+                     for order in ([0, 1], [1, 0])]
+            for index, result in pool.imap(play_candidate, tasks, chunksize,
+                                           ordered=False):
+                candidates[index].results.add(result)
+            tuning.seeds += seeds
+            tuning.rounds += 1
+            if len(alive) == 1:
+                if callback is not None: callback(tuning)
+                break
+            alive.sort(key=lambda index: -candidates[index].margin()[0])
+            keep = int(math.ceil(len(alive) / float(eta)))
+            for index in alive[keep:]:
+                candidates[index].dropped = tuning.rounds
+            alive = alive[:keep]
+            seeds *= eta
+            if callback is not None: callback(tuning)
+    finally:
+        pool.close()
+    return tuning
+
+def parse_grid(specs):
+    """
+    Parse arguments such as "cutoff1=2,3,4" into a grid for tune(). Values
+    are evaluated as Python expressions.
+    """
+    grid = {}
+    for spec in specs:
+        name, values = spec.split('=', 1)
+        grid[name.strip()] = [eval(value) for value in values.split(',')]
+    return grid
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+      description="Tune a bot's constructor parameters by successive halving."
+    )
+    parser.add_argument('bot', help='the bot class, such as SmithyBot')
+    parser.add_argument('grid', nargs='+', metavar='NAME=VALUES',
+      help='a parameter and the values to try, such as cutoff1=2,3,4')
+    parser.add_argument('--opponent', default='BigMoney',
+      help='the bot to play against (default: BigMoney)')
+    parser.add_argument('-n', '--games', type=int, default=8,
+      help='games per configuration in the first round')
+    parser.add_argument('--eta', type=int, default=2,
+      help='keep 1/ETA of the configurations after each round')
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    namespace = bot_namespace()
+    bot_class = namespace[args.bot]
+    opponent = parse_bot(args.opponent, namespace)
+    def progress(tuning):
+        print tuning.summary(limit=len(tuning.alive()))
+        print
+    tuning = tune(bot_class, parse_grid(args.grid), opponent, args.games,
+                  args.eta, processes=args.processes, seed=args.seed,
+                  callback=progress)
+    print tuning
+
+if __name__ == '__main__':
+    main()